@@ -1,11 +1,15 @@
+import os
 
 # -- globals
 
-ADR_VERSION   = "http://opendata-download-metobs.smhi.se/api/version/1.0.json"
-ADR_PARAMETER = "http://opendata-download-metobs.smhi.se/api/version/1.0/parameter/{parameter}.json" 
-ADR_STATION = "http://opendata-download-metobs.smhi.se/api/version/1.0/parameter/{parameter}/station/{station}.json"
-ADR_LATEST_MONTHS = "http://opendata-download-metobs.smhi.se/api/version/1.0/parameter/{parameter}/station/{station}/period/latest-months/data.json"
-ADR_CORRECTED = "http://opendata-download-metobs.smhi.se/api/version/1.0/parameter/{parameter}/station/{station}/period/corrected-archive/data.csv"
+# Root of the SMHI API, set SMHI_API_ROOT to use another server (e.g. a local test server)
+API_ROOT = os.environ.get('SMHI_API_ROOT', "http://opendata-download-metobs.smhi.se/api")
+
+ADR_VERSION   = API_ROOT + "/version/1.0.json"
+ADR_PARAMETER = API_ROOT + "/version/1.0/parameter/{parameter}.json" 
+ADR_STATION = API_ROOT + "/version/1.0/parameter/{parameter}/station/{station}.json"
+ADR_LATEST_MONTHS = API_ROOT + "/version/1.0/parameter/{parameter}/station/{station}/period/latest-months/data.json"
+ADR_CORRECTED = API_ROOT + "/version/1.0/parameter/{parameter}/station/{station}/period/corrected-archive/data.csv"
 
 
 
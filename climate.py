@@ -5,7 +5,16 @@ Created on Sun May 22 15:10:49 2022
 @author: Johan Odelius
 """
 import smhi
-from helpers import get_types, validatestring
+import cube
+import results
+import inspect
+import json
+import logging
+import operator
+import numpy as np
+import pandas as pd
+from helpers import get_type_bits, get_type_mask, get_type_mask_frame, validatestring, get_filter, filter_times, set_index, is_sorted_time, window_positions
+from series import StationSeries, WindowIndex, RunIndex
     
 # sub functions
 climate_weather_parameters = {
@@ -26,6 +35,215 @@ climate_weather_parameters = {
     }
 climate_weather_parameters['combination'] = climate_weather_parameters['temperature'] + climate_weather_parameters['precipitation']
 
+# Daily aggregate of hourly weather parameters used by the indicators, read from the 
+# daily values of smhi.get_daily when the time windows are whole days (see is_daily)
+daily_aggregates = {
+    'WindSpeed' : 'max',
+    'WindGust' : 'max'
+    }
+
+# Weather parameters of precipitation types, converted to daily type masks when loaded
+type_parameters = ['PrecipTypePast24h']
+
+# Index column of weather parameters with hourly timestamps
+parameter_index = {
+    'WindSpeed' : 'Date (UTC)',
+    'WindGust' : 'Date (UTC)',
+    'SnowDepthPast24h' : 'Date (UTC)'
+    }
+
+def get_parameter_values(weather_parameters, station, ts, time_period, data=None, compact=False):
+    # Values of one or several weather parameters filtered on timestamp and time period
+    # Input
+    #   weather_parameters : weather parameter name or list of names
+    #   station         : station id [int]
+    #   ts              : timestamp, or date range (start, end) for one value per time period
+    #   time_period     : time period ('y','s','m')
+    #   data            : dict of pre-filtered values per weather parameter (optional), 
+    #                     parameters not in data are downloaded concurrently
+    #   compact         : keep StationSeries of data (else converted to pandas Series),
+    #                     for indicators using only thresholds, aggregate and run_length
+    # Output
+    #   values (list of values if weather_parameters is a list)
+    if isinstance(weather_parameters, str):
+        return get_parameter_values([weather_parameters], station, ts, time_period, data, compact)[0]
+    if data is None:
+        data = {}
+    
+    # get_values slices the time window of ts from the cube or the store
+    sliced = [param for param in weather_parameters if param not in data and is_sliced(param, station)]
+    # Hourly parameters read from their daily aggregates
+    daily = [param for param in weather_parameters 
+             if param not in data and param not in sliced and param in daily_aggregates and is_daily(ts, time_period)]
+    missing = [(smhi.get_param_value(param), station, parameter_index.get(param, 'Date')) 
+               for param in weather_parameters if param not in data and param not in daily and param not in sliced]
+    archives = smhi.get_many(missing, func=smhi.get_indexed)
+    dailies = smhi.get_many([(smhi.get_param_value(param), station) for param in daily], func=smhi.get_daily)
+    
+    values = []
+    for param in weather_parameters:
+        if param in data:
+            if isinstance(data[param], StationSeries) and not compact:
+                values.append(data[param].to_series())
+            else:
+                values.append(data[param])
+        elif param in daily:
+            values.append(smhi.get_values(param, station, ts, time_period, col=daily_aggregates[param], 
+                                          data=dailies[(smhi.get_param_value(param), station)]))
+        else:
+            idx = parameter_index.get(param, 'Date')
+            value = smhi.get_values(param, station, ts, time_period, idx=idx, 
+                                    data=archives.get((smhi.get_param_value(param), station, idx)))
+            if param in type_parameters:
+                # Types observed each day as bitmask, see has_type
+                value = get_type_mask(value)
+            values.append(value)
+    return values
+
+# Resample rule of each time period, used when ts is a date range (start, end)
+period_rules = {
+    'm' : 'MS',
+    's' : 'QS-DEC',
+    'y' : 'AS'
+    }
+
+def is_range(ts):
+    # ts given as date range (start, end), i.e. one value per time period
+    return isinstance(ts, (list, tuple))
+
+def is_sliced(param, station):
+    # Values of weather parameter at station are sliced by smhi.get_values from the columnar
+    # store or the memory-mapped cube (see store.py and cube.py), not loaded as a whole
+    if smhi.STORE_DIR:
+        return True
+    return (bool(smhi.CUBE_DIR) and parameter_index.get(param, 'Date') == 'Date (UTC)' 
+            and cube.has_station(smhi.get_param_value(param), station))
+
+def is_daily(ts, time_period, direction=None):
+    # ts (or date range) and the windows of time period are whole days, so that hourly 
+    # weather parameters give the same result from their daily aggregates
+    import datetime
+    for t in (ts if is_range(ts) else [ts]):
+        if isinstance(t, datetime.datetime) or not isinstance(t, (str, datetime.date)) or len(str(t))>10:
+            return False
+    if is_range(ts):
+        return True
+    if direction is not None or not isinstance(time_period, str):
+        return False
+    try:
+        # timedelta windows, as in helpers.get_filter
+        pd.to_timedelta(time_period)
+        return False
+    except ValueError:
+        return True
+
+def period_grouper(values, ts, time_period):
+    # Group keys of the time periods, a single group unless ts is a date range
+    if is_range(ts):
+        return pd.Grouper(freq=period_rules.get(time_period, time_period))
+    return np.zeros(len(values), dtype=int)
+
+def aggregate(values, ts, time_period, func):
+    # Aggregate values during the time period
+    # Input
+    #   values          : series of values (pandas Series or StationSeries)
+    #   ts              : timestamp or date range (start, end)
+    #   time_period     : time period ('y','s','m')
+    #   func            : aggregation ('sum','max','min','mean') or function of a series
+    # Output
+    #   value, series with one value per time period if ts is a date range
+    if isinstance(values, StationSeries):
+        return values.aggregate(func, period_rules.get(time_period, time_period) if is_range(ts) else None)
+    if is_range(ts):
+        # Single resample of the whole date range
+        grouped = values.resample(period_rules.get(time_period, time_period))
+        if callable(func):
+            value = grouped.apply(lambda ser: func(ser) if ser.size>0 else float('NaN'))
+        else:
+            value = grouped.agg(func)
+        # Periods without values
+        return value.where(grouped.size()>0)
+    
+    if values.size>0:
+        if callable(func):
+            return func(values)
+        return getattr(values, func)()
+    return float('NaN')
+
+def run_length(mask, ts, time_period):
+    # Number of days in a row with mask True, restarted each time period
+    if isinstance(mask, StationSeries):
+        return mask.run_length(period_rules.get(time_period, time_period) if is_range(ts) else None)
+    return mask.groupby([period_grouper(mask, ts, time_period), (~mask).cumsum()]).cumsum()
+
+# Comparisons of the threshold indicators, for pandas Series and StationSeries
+comparisons = {
+    '>' : operator.gt,
+    '>=' : operator.ge,
+    '<' : operator.lt,
+    '<=' : operator.le
+    }
+
+def count_days(values, ts, time_period, comparison, threshold):
+    # Number of days with values compared to threshold during the time period
+    # Input
+    #   values          : series of values (pandas Series or StationSeries)
+    #   comparison      : '>', '>=', '<' or '<='
+    #   threshold       : threshold, or list of thresholds counted together (see count_thresholds)
+    if np.ndim(threshold) == 0:
+        return aggregate(comparisons[comparison](values, threshold), ts, time_period, 'sum')
+    return count_thresholds(values, ts, time_period, comparison, threshold)
+
+def count_thresholds(values, ts, time_period, comparison, thresholds):
+    # Number of values compared to each of several thresholds during the time period, 
+    # from the sorted values of each time period instead of one mask per threshold
+    # Output
+    #   Series of counts indexed by threshold, or DataFrame with one row per time period 
+    #   and one column per threshold if ts is a date range (NaN for periods without values)
+    thresholds = np.asarray(thresholds, dtype='float64')
+    if isinstance(values, StationSeries):
+        days, x = values.days, values.floats()
+    else:
+        days, x = values.index.values.astype('datetime64[D]').astype('int32'), values.values.astype('float64')
+    if is_range(ts):
+        starts, bounds = StationSeries(days, x).period_bounds(period_rules.get(time_period, time_period))
+        index = pd.DatetimeIndex(starts.astype('datetime64[M]').astype('datetime64[ns]'), name='Date')
+    else:
+        bounds = np.array([0, len(x)])
+    
+    counts = np.full((len(bounds)-1, len(thresholds)), np.nan)
+    for i, (i1, i2) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if i2 == i1:
+            continue
+        # Sorted values of the time period without NaN (never counted)
+        period = np.sort(x[i1:i2])
+        period = period[:len(period)-np.isnan(period).sum()]
+        if comparison in ['<', '<=']:
+            counts[i] = period.searchsorted(thresholds, 'left' if comparison == '<' else 'right')
+        else:
+            counts[i] = len(period) - period.searchsorted(thresholds, 'right' if comparison == '>' else 'left')
+    
+    columns = pd.Index(thresholds, name='threshold')
+    if is_range(ts):
+        return pd.DataFrame(counts, index=index, columns=columns)
+    return pd.Series(counts[0], index=columns)
+
+def has_type(types, index, cat):
+    # True on the days of index with a precipitation type of category cat (see helpers.get_type_mask)
+    mask = get_type_mask(types)
+    if not mask.index.equals(index):
+        mask = mask.reindex(index, fill_value=0)
+    return (mask.values & get_type_bits(cat)) != 0
+
+def count_type_days(mask, valid, ts, time_period):
+    # Number of days of mask during the time period, NaN if no day has the 
+    # precipitation type (valid, see has_type)
+    value = aggregate(mask, ts, time_period, 'sum')
+    has_days = aggregate(pd.Series(valid, mask.index), ts, time_period, 'max')
+    if is_range(ts):
+        return value.where(has_days == True)
+    return value if has_days == True else float('NaN')
+
 def list_stations(parameter_type='all', ts=None):
     if parameter_type.lower() == 'all':
         # list all climate paramters
@@ -37,16 +255,19 @@ def list_stations(parameter_type='all', ts=None):
         ty = validatestring(parameter_type, climate_weather_parameters.keys())
         parameters = climate_weather_parameters[ty]
     
-    # Make variable a set, i.e. remove dublicates
-    paramsset = set(parameters)
+    # Remove dublicates, keeping the order of parameters
+    paramsset = list(dict.fromkeys(parameters))
+    
+    # Station lists of all parameters from the station index (missing lists downloaded concurrently)
+    smhi.get_station_index(paramsset)
+    station_lists = [smhi.list_stations(param, ts) for param in paramsset]
     
     # Find stations for first parameter
-    df_stations = smhi.list_stations(paramsset.pop(), ts=ts)
+    df_stations = station_lists[0]
     # Make stations id a set
     stations = set(df_stations['id'])
     # Loop the rest of parameters and update stations list with intersection
-    for param in paramsset:
-        df = smhi.list_stations(param, ts=ts)
+    for df in station_lists[1:]:
         stations = stations.intersection(df['id'].to_list())
     
     # Output columns of dataframe
@@ -64,11 +285,14 @@ def get_stations(station, ts, time_period='y', parameter_type='all'):
     if parameter_type.lower() == 'all':
         parameter_type = climate_weather_parameters.keys()
     
+    # Download data for all parameters concurrently
+    archives = smhi.get_many([(param, station) for ty in parameter_type for param in climate_weather_parameters[ty]])
+    
     # Loop the parameters and update stations list with intersection
     data = {}
     for ty in parameter_type:
         for k,param in enumerate(climate_weather_parameters[ty]):
-            values = smhi.get_values(param, station, ts=ts, time_period=time_period)
+            values = smhi.get_values(param, station, ts=ts, time_period=time_period, data=archives[(param, station)])
             print(param)
             print(values.size)
             if values.size>0:
@@ -91,634 +315,649 @@ def get_stations(station, ts, time_period='y', parameter_type='all'):
 # %% Temperature
 
 # Medeltemperatur
-def TAS(station, ts, time_period='y'):
+def TAS(station, ts, time_period='y', data=None):
     # Medeltemperatur (TAS)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp ('2020-01-10')
+    #   ts              : timestamp ('2020-01-10'), or date range (start, end) for one value per time period
     #   time_period     : time period ('y','s'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
     weather_parameter = 'TemperatureMeanPastMonth'
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
     # Mean of TemperatureMeanPastMonth
-    value = parameter_values.mean()
+    value = aggregate(parameter_values, ts, time_period, 'mean')
 
     return value
 
 # Dygnsmaxtemperatur
-def TX(station, ts, time_period='y'):
+def TX(station, ts, time_period='y', data=None):
     # Dygnsmaxtemperatur (TX)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y','s','m'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
     weather_parameter = 'TemperatureMaxPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
     # Max of TemperatureMaxPast24h
-    value = parameter_values.max()
+    value = aggregate(parameter_values, ts, time_period, 'max')
 
     return value
 
 
 # Dygnsminimitemperatur
-def TN(station, ts, time_period='y'):
+def TN(station, ts, time_period='y', data=None):
     # Dygnsminimitemperatur (TN)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y','s','m'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
     weather_parameter = 'TemperatureMinPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
     # Min of TemperatureMinPast24h
-    value = parameter_values.min()
+    value = aggregate(parameter_values, ts, time_period, 'min')
 
     return value
 
 
 # Dygnsamplitud (varmast minus kallast)
-def DTR(station, ts, time_period='m'):
+def DTR(station, ts, time_period='m', data=None):
     # Dygnsamplitud (varmast minus kallast) (DTR)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('m'), default 'm'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'TemperatureMinPast24h'
-    # Filter based on failure time and time period
-    temperature_min = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['TemperatureMinPast24h', 'TemperatureMaxPast24h']
+    # Download concurrently and filter based on failure time and time period
+    temperature_min, temperature_max = get_parameter_values(weather_parameters, station, ts, time_period, data, compact=True)
     
-    weather_parameter = 'TemperatureMaxPast24h'
-    # Filter based on failure time and time period
-    temperature_max = smhi.get_values(weather_parameter, station, ts, time_period)
-   
     # Amplitude: max temperature - min temperature
     amplitude = temperature_max-temperature_min
 
     # Max of daily amplitude values
-    value = amplitude.max()
+    value = aggregate(amplitude, ts, time_period, 'max')
 
     return value
 
 
 # Varma dagar/högsommardagar (Maxtemperatur >20 ºC)
-def WarmDays(station, ts, time_period='y'):
+def WarmDays(station, ts, time_period='y', threshold=20, data=None):
     # Varma dagar (WarmDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y','s'), default 'y'
+    #   threshold       : threshold [deg C], default 20, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
     weather_parameter = 'TemperatureMaxPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
-    # Number of days over 20 deg
-    value = (parameter_values > 20).sum()
+    # Number of days over 20 deg (or each threshold)
+    value = count_days(parameter_values, ts, time_period, '>', threshold)
 
     return value
 
 
 # Värmebölja (dagar i följd med maxtemperatur > 20ºC)
-def ConWarmDays(station, ts, time_period='y'):
+def ConWarmDays(station, ts, time_period='y', data=None):
     # Värmebölja (ConWarmDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
     weather_parameter = 'TemperatureMaxPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
     # Days in a row with temperature more than 20 deg
-    number_of_days = 0
-    max_number_of_days = 0
     temperature_threshold = 20
-    for value in parameter_values:
-        if value > temperature_threshold:
-            number_of_days += 1
-            max_number_of_days = max(max_number_of_days, number_of_days)
-        else:
-            number_of_days = 0
+    number_of_days = run_length(parameter_values > temperature_threshold, ts, time_period)
+    
+    # Longest period of days in a row
+    max_number_of_days = aggregate(number_of_days, ts, time_period, 'max')
 
     return max_number_of_days
 
 # Nollgenomgångar (Antal dagar med högsta temp > 0ºC och lägsta temp < 0ºC)
-def ZeroCrossingDays(station, ts, time_period='s'):
+def ZeroCrossingDays(station, ts, time_period='s', data=None):
     # Nollgenomgångar (ZeroCrossingDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('s'), default 's'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'TemperatureMinPast24h'
-    # Filter based on failure time and time period
-    temperature_min = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['TemperatureMinPast24h', 'TemperatureMaxPast24h']
+    # Download concurrently and filter based on failure time and time period
+    temperature_min, temperature_max = get_parameter_values(weather_parameters, station, ts, time_period, data, compact=True)
     
-    weather_parameter = 'TemperatureMaxPast24h'
-    # Filter based on failure time and time period
-    temperature_max = smhi.get_values(weather_parameter, station, ts, time_period)
-
     # Min temperature less than 0 and max temperature more than 0
-    if temperature_min.size>0:
-        if isinstance(ts, (list, tuple)):
-            if time_period == 's':
-                time_period = '3M'
-            value = ((temperature_min < 0) & (temperature_max > 0)).resample(time_period).sum()
-        else:
-            value = ((temperature_min < 0) & (temperature_max > 0)).sum()
-    else:
-        value = float('NaN')
+    value = aggregate((temperature_min < 0) & (temperature_max > 0), ts, time_period, 'sum')
 
     return value
 
 # Vegetationsperioden
+# Temperatures of the vegetation season indicators, calculated together (see veg_seasons)
+veg_temperatures = [2, 5]
+
+def veg_seasons(ser, temperatures=veg_temperatures, days=4, rule=None):
+    # Vegetation season (see VegSeason) of each time period and temperature at once, 
+    # from the runs of days above and below each temperature in the whole series
+    # Input
+    #   ser             : daily temperature, indexed by sorted dates
+    #   temperatures    : list of temperatures
+    #   days            : days in a row above/below temperature
+    #   rule            : resample rule of the time periods (period_rules), None for one period
+    # Output
+    #   periods         : start of each time period as aggregate (None if rule is None)
+    #   filled          : time periods with values
+    #   rows            : rows of ser of vegperiod (start, end) of each time period, per temperature
+    n = ser.size
+    values = ser.values
+    if rule is None:
+        periods = None
+        bounds = np.array([0, n]) if n > 0 else np.zeros(1, dtype='int64')
+    else:
+        days_since = ser.index.values.astype('datetime64[D]').astype('int32')
+        starts, bounds = StationSeries(days_since, values).period_bounds(rule)
+        periods = pd.DatetimeIndex(starts.astype('datetime64[M]').astype('datetime64[ns]'), name=ser.index.name)
+    i1, i2 = bounds[:-1], bounds[1:]
+    filled = i2 > i1
+    
+    # Days from 1 July, where the vegperiod can end
+    autumn = ser.index.month >= 7
+    rows = {}
+    for temperature in temperatures:
+        # Vegperiod start, the 4th day of the first run above (no vegperiod if not found)
+        start = RunIndex(values > temperature).first(i1, i2, days)
+        start = np.where(start < 0, i2-1, start)
+        # Vegperiod end, the day before the first run below from 1 July after the start 
+        # (vegperiod to the end if not found)
+        end = RunIndex(autumn & (values <= temperature)).first(start, i2, days)
+        end = np.where(end < 0, i2-1, np.maximum(end-days, start))
+        rows[temperature] = (np.where(filled, start, 0), np.where(filled, end, 0))
+    return periods, filled, rows
+
 def VegSeason(ser, temperature=5, days=4):
     # 4 days in a row with temperature more than 5 deg
+    _, _, rows = veg_seasons(ser, [temperature], days)
+    start, end = rows[temperature]
+    return ser.index[start[0]], ser.index[end[0]]
 
-    # Initialize variables
-    number_of_days_above = 0
-    veg_start = ser.iloc[-1]
-    
-    for idx, value in ser.iteritems():
-        if value > temperature:
-            number_of_days_above += 1
-            if number_of_days_above >= days:
-                veg_start = idx  # Vegperiod start
-                break
-        else:
-            number_of_days_above = 0
-    
-    # Initialize variables
-    number_of_days_below = 0
-    previous = ser.loc[[veg_start]].index
-    for idx, value in ser.loc[veg_start:].iteritems():
-        # if start of vegperiod set and after 1 July 
-        if idx.month >= 7 and value <= temperature:
-            number_of_days_below += 1
-            if number_of_days_below >= days:
-                veg_end = previous  # Vegperiod slut
-                break
-        else:
-            number_of_days_below = 0
-            previous = idx
-    
-    return veg_start, veg_end
+def get_shared(data, key):
+    # Intermediate results in data shared by several indicators of the same values (None if not given)
+    return None if data is None else data.get(key)
+
+def get_veg_season(values, ts, time_period, temperature, column, seasons=None):
+    # Vegperiod 'start', 'end' or 'length' at temperature during the time period, one kernel 
+    # call (veg_seasons) for all veg_temperatures
+    # Input
+    #   seasons         : dict of kernel results of values (optional), shared by the three 
+    #                     indicators of the same values (see calc)
+    if not is_range(ts) and values.size == 0:
+        return float('NaN')
+    temperatures = tuple(dict.fromkeys(veg_temperatures + [temperature]))
+    rule = period_rules.get(time_period, time_period) if is_range(ts) else None
+    if seasons is None:
+        seasons = {}
+    if (temperatures, rule) not in seasons:
+        seasons[(temperatures, rule)] = veg_seasons(values, temperatures, rule=rule)
+    periods, filled, rows = seasons[(temperatures, rule)]
+    
+    start, end = rows[temperature]
+    if column == 'start':
+        value = values.index[start]
+    elif column == 'end':
+        value = values.index[end]
+    else:
+        value = (values.index[end] - values.index[start]).days
+    if is_range(ts):
+        # One value per time period, NaN for periods without values
+        return pd.Series(value, index=periods).where(filled)
+    return int(value[0]) if column == 'length' else value[0]
 
 # Vegetationsperiodens slut (sista dag i sammanhängande 4-dags period med medeltemp > 5ºC
-def VegSeasonDayEnd(station, ts, time_period='y'):
+def VegSeasonDayEnd(station, ts, time_period='y', data=None):
     # Vegetationsperiodens slut (VegSeasonDayEnd-5)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
+    #                     and of vegperiods in 'VegSeasons' (see get_veg_season)
     weather_parameter = 'TemperaturePast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data)
     
     # Vegperiod
-    _,veg_end = VegSeason(parameter_values)
+    veg_end = get_veg_season(parameter_values, ts, time_period, 5, 'end', get_shared(data, 'VegSeasons'))
 
     # Returning last date of vegperiod
     return veg_end
 
 
 # Vegetationsperiodens början (sista dag i sammanhängande 4-dags period med medeltemp > 5 ºC)
-def VegSeasonDayStart(station, ts, time_period='y'):
+def VegSeasonDayStart(station, ts, time_period='y', data=None):
     # Vegetationsperiodens början (VegSeasonDayStart-5)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
+    #                     and of vegperiods in 'VegSeasons' (see get_veg_season)
     weather_parameter = 'TemperaturePast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data)
     
     # Vegperiod
-    veg_start,_ = VegSeason(parameter_values)
+    veg_start = get_veg_season(parameter_values, ts, time_period, 5, 'start', get_shared(data, 'VegSeasons'))
 
     # Returning first date of vegperiod
     return veg_start
 
 
 # Vegetationsperiodens längd (medeltemp > 2/5ºC)
-def VegSeasonLentgh(station, ts, time_period='y', temperature=5):
+def VegSeasonLentgh(station, ts, time_period='y', temperature=5, data=None):
     # Vegetationsperiodens längd (VegSeasonLentgh-2/VegSeasonLentgh-5)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
     #   temperature     : temperature definition of vegseason (2,5), default is 5
+    #   data            : dict of pre-filtered values per weather parameter (optional)
+    #                     and of vegperiods in 'VegSeasons' (see get_veg_season)
 
     weather_parameter = 'TemperaturePast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data)
     
-    # Vegperiod
-    veg_start,veg_end = VegSeason(parameter_values)
-
     # Returning length in days of vegperiod
-    return (veg_end-veg_start).days
+    return get_veg_season(parameter_values, ts, time_period, temperature, 'length', get_shared(data, 'VegSeasons'))
 
 
 # Frostdagar (minimitemperatur < 0ºC )
-def FrostDays(station, ts, time_period='s'):
+def FrostDays(station, ts, time_period='s', threshold=0, data=None):
     # Frostdagar (FrostDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('s'), default 's'
+    #   threshold       : threshold [deg C], default 0, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
 
     weather_parameter = 'TemperatureMinPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
     
-    # Count days where min temperature is less than 0
-    value = (parameter_values < 0).sum()
+    # Count days where min temperature is less than 0 (or each threshold)
+    value = count_days(parameter_values, ts, time_period, '<', threshold)
 
     return value
 
 
 # Kalla dagar (maxtemperatur < -7ºC)
-def ColdDays(station, ts, time_period='s'):
+def ColdDays(station, ts, time_period='s', threshold=-7, data=None):
     # Kalla dagar (ColdDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('s'), default 's'
+    #   threshold       : threshold [deg C], default -7, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'TemperatureMaxPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
-    # Days with max temperature less than -7
-    value = (parameter_values < -7).sum()
+    # Days with max temperature less than -7 (or each threshold)
+    value = count_days(parameter_values, ts, time_period, '<', threshold)
 
     return value
 
 # %% Nederbörd
 
 # Summa nederbörd
-def PR(station, ts, time_period='y'):
+def PR(station, ts, time_period='y', data=None):
     # Summa nederbörd (PR)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('m','y','s'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'PrecipPast24hAt06'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
     
     # Sum of PrecipPast24hAt06
-    value = parameter_values.sum()
+    value = aggregate(parameter_values, ts, time_period, 'sum')
 
     return value
 
 
 # Summa regn
-def PRRN(station, ts, time_period='y'):
+def PRRN(station, ts, time_period='y', data=None):
     # Summa nederbörd (PRRN)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period (y','s'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    # Join precipitation values with type of precipitation
-    precip_data = precip_values.to_frame().join(precip_types.rename('Type'))
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    # Data for days with rain
-    valid_types = get_types('Rain')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types),'Value'].groupby(level=0).first()
+    # Precipitation values of days with rain (type of precipitation of the day)
+    precip_valid = precip_values.where(has_type(precip_types, precip_values.index, 'Rain'))
     
     # Sum up all during time period
-    value = precip_valid.sum()
+    value = aggregate(precip_valid, ts, time_period, 'sum')
                         
     return value
 
 
 # Summa snö
-def PRSN(station, ts, time_period='y'):
+def PRSN(station, ts, time_period='y', data=None):
     # Summa snö (PRSN)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period (y','s'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    # Join precipitation values with type of precipitation
-    precip_data = precip_values.to_frame().join(precip_types.rename('Type'))
-     
-    # Data for days with valid precipitation
-    valid_types = get_types('Snow')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types),'Value'].groupby(level=0).first()
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types = get_parameter_values(weather_parameters, station, ts, time_period, data)
+    
+    # Precipitation values of days with snow (type of precipitation of the day)
+    precip_valid = precip_values.where(has_type(precip_types, precip_values.index, 'Snow'))
     
     # Sum up all during time period
-    value = precip_valid.sum()  
+    value = aggregate(precip_valid, ts, time_period, 'sum')
     
     return value
 
 
 # Summa underkylt regn
-def SuperCooledPR(station, ts, time_period='y'):
+def SuperCooledPR(station, ts, time_period='y', data=None):
     # Underkylt regn (SuperCooledPR)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    # Join precipitation values with type of precipitation
-    precip_data = precip_values.to_frame().join(precip_types.rename('Type'))
-     
-    # Cooled rain types
-    valid_types = get_types('SuperCooledRain')
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    # Data for days with valid precipitation
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types),'Value'].groupby(level=0).first()
+    # Precipitation values of days with supercooled rain (type of precipitation of the day)
+    precip_valid = precip_values.where(has_type(precip_types, precip_values.index, 'SuperCooledRain'))
     
     # Sum up all during time period
-    value = precip_valid.sum()
+    value = aggregate(precip_valid, ts, time_period, 'sum')
 
     return value
 
 
 # Högsta nederbörd under 7 dagar
-def PR7Dmax(station, ts, time_period='y'):
+def PR7Dmax(station, ts, time_period='y', data=None):
     # Högsta nederbörd  (PR7Dmax)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'PrecipPast24hAt06'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data)
     
-    # Sum of PrecipPast24hAt06 for rolling window of 7 days (sum or max??)
-    values = parameter_values.rolling(7).sum()
+    # Sum of PrecipPast24hAt06 for rolling window of 7 days (sum or max??), 
+    # windows within the time period
+    days = 7
+    values = parameter_values.rolling(days).sum()
+    values = values.where(parameter_values.groupby(period_grouper(parameter_values, ts, time_period)).cumcount() >= days-1)
 
     # Max of sum of precipitation
-    return values.max()
+    return aggregate(values, ts, time_period, 'max')
 
 
 # Maximal nederbördsintensitet
-def PRmax(station, ts, time_period='y'):
+def PRmax(station, ts, time_period='y', data=None):
     # Maximal nederbörd  (PRmax)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'PrecipPast24hAt06'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
     # Max of PrecipPast24hAt06
-    value = parameter_values.max()
+    value = aggregate(parameter_values, ts, time_period, 'max')
 
     return value
 
 
 # Maximal snöfallsintensitet
-def PRSNmax(station, ts, time_period='y'):
+def PRSNmax(station, ts, time_period='y', data=None):
     # Maximal snöfall  (PRSNmax)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    # Join precipitation values with type of precipitation
-    precip_data = precip_values.to_frame().join(precip_types.rename('Type'))
-  
-    # Snow types
-    valid_types = get_types('Snow') 
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    # precip_data.loc[precip_data['Type'].isin(valid_types)].groupby('Type').max()
-    
-    # Data for days with valid precipitation
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types),'Value'].groupby(level=0).first()
+    # Precipitation values of days with snow (type of precipitation of the day)
+    precip_valid = precip_values.where(has_type(precip_types, precip_values.index, 'Snow'))
     
     # Max during time period
-    value = precip_valid.max()
+    value = aggregate(precip_valid, ts, time_period, 'max')
 
     return value
 
 
 # Kraftig nederbörd > 10 mm/dygn
-def PRgt10Days(station, ts, time_period='y'):
+def PRgt10Days(station, ts, time_period='y', threshold=10, data=None):
     # Kraftig nederbörd  (PRgt10Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('s','y'), default 'y'
+    #   threshold       : threshold [mm], default 10, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'PrecipPast24hAt06'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
-    # Days of more than 10 mm precip
-    value = (parameter_values > 10).sum()
+    # Days of more than 10 mm precip (or each threshold)
+    value = count_days(parameter_values, ts, time_period, '>', threshold)
 
     return value
 
 # Extrem nederbörd > 25 mm/dygn
-def PRgt25Days(station, ts, time_period='y'):
+def PRgt25Days(station, ts, time_period='y', threshold=25, data=None):
     # Extrem nederbörd  (PRgt25Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('s','y'), default 'y'
+    #   threshold       : threshold [mm], default 25, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'PrecipPast24hAt06'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
-    # Days of more than 25 mm precip
-    value = (parameter_values > 25).sum()
+    # Days of more than 25 mm precip (or each threshold)
+    value = count_days(parameter_values, ts, time_period, '>', threshold)
 
     return value
 
 
 # Torra dagar (med nederbörd < 1 mm)
-def DryDays(station, ts, time_period='m'):
+def DryDays(station, ts, time_period='m', threshold=1, data=None):
     # Torra dagar  (DryDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('m'), default 'm'
+    #   threshold       : threshold [mm], default 1, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'PrecipPast24hAt06'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
-    # Days of less than 1 mm precip
-    if parameter_values.size>0:
-        value = (parameter_values < 1).sum()
-    else:
-        value = float('NaN')
+    # Days of less than 1 mm precip (or each threshold)
+    value = count_days(parameter_values, ts, time_period, '<', threshold)
 
     return value
 
 # %% Snö på marken
 # Snötäcke
-def SncDays(station, ts, time_period='y'):
+def SncDays(station, ts, time_period='y', threshold=0, data=None):
     # Snötäcke  (SncDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   threshold       : threshold [m], default 0, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'SnowDepthPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
-    # Number of days with snow
-    if parameter_values.size>0:
-        value = (parameter_values > 0).sum()
-    else:
-        value = float('NaN')
+    # Number of days with snow (or snow depth over each threshold)
+    value = count_days(parameter_values, ts, time_period, '>', threshold)
         
     return value
 
 # Maximalt snödjup (räknat som vatteninnehåll)
-def SNWmax(station, ts, time_period='y'):
+def SNWmax(station, ts, time_period='y', data=None):
     # Maximalt snödjup  (SNWmax)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'SnowDepthPast24h'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data, compact=True)
 
     # Maximum snow depth
-    value = parameter_values.max()
+    value = aggregate(parameter_values, ts, time_period, 'max')
 
     return value
 
 # %% Vind och densitet
 
 # Medelvindhastighet i 10m-nivå
-def SfcWind(station, ts, time_period='y'):
+def SfcWind(station, ts, time_period='y', data=None):
     # Medelvindhastighet  (SfcWind)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('s','y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'WindSpeed'
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, ts, time_period, idx='Date (UTC)')
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data)
     
     # Daily max of mean windspeed observations
     values = parameter_values.resample('1D').max()
 
     # Max of daily max during time period
-    return values.max()
+    return aggregate(values, ts, time_period, 'max')
 
 # Maximal byvind (10m-nivå)
 
 
-def WindGustMax(station, ts, time_period='y'):
+def WindGustMax(station, ts, time_period='y', data=None):
     # Maximal byvind  (WindGustMax)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'WindGust'  # Wind Gust
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, ts, time_period, idx='Date (UTC)')
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data)
     
     # Daily max of wind gust (byvind) observations
     values = parameter_values.resample('1D').max()
 
     # Max of daily max during time period
-    return values.max()
+    return aggregate(values, ts, time_period, 'max')
 
 
 # Antal dagar med byvind >21 m/s (10m-nivå)
-def WindyDays(station, ts, time_period='y'):
+def WindyDays(station, ts, time_period='y', threshold=21, data=None):
     # Antal dagar med hård byvind  (WindyDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   threshold       : threshold [m/s], default 21, or list of thresholds for one count per threshold
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
     weather_parameter = 'WindGust'  # Wind Gust
     # Filter based on failure time and time period
-    parameter_values = smhi.get_values(weather_parameter, ts, time_period, idx='Date (UTC)')
+    parameter_values = get_parameter_values(weather_parameter, station, ts, time_period, data)
     
-    # Number of days with daily max of wind gust (byvind) above 21
-    if parameter_values.size>0:
-        value = (parameter_values.resample('1D').max() > 21).sum()
-    else:
-        value = float('NaN')
+    # Number of days with daily max of wind gust (byvind) above 21 (or each threshold)
+    value = count_days(parameter_values.resample('1D').max(), ts, time_period, '>', threshold)
 
     return value
 
 #%% Kombinationsindex
 
 # Nederbörd när temperaturen ligger mellan 0.58 och 2 grader
-def ColdRainDays(station, ts, time_period='y'):
+def ColdRainDays(station, ts, time_period='y', data=None):
     # Dagar kall nederbörd  (ColdRainDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
     # weather_parameter = 'PrecipTypePast24h'
     # # Filter based on failure time and time period
-    # precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
+    # precip_types = get_parameter_values(weather_parameter, station, ts, time_period, data)
 
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
     # Add temperture values to the precipitaion values
     precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
     # precip_data = precip_data.join(precip_types.rename('Type'))
@@ -726,36 +965,30 @@ def ColdRainDays(station, ts, time_period='y'):
     # precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)]
     
     # Days with precip given temperature interval
-    if precip_values.size>0:
-        temperature_threshold = [.58, 2]
-        i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
-        value = (precip_data.loc[i_temperature,'Value']>0).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = [.58, 2]
+    i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
+    value = aggregate(i_temperature & (precip_data['Value']>0), ts, time_period, 'sum')
 
     return value
 
 
 # Nederbörd ( > 10 mm/dygn) när temperaturen ligger mellan 0.58 och 2 grader
-def ColdRainGT10Days(station, ts, time_period='y'):
+def ColdRainGT10Days(station, ts, time_period='y', data=None):
     # Dagar mkt kall nederbörd  (ColdRainGT10Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
     # weather_parameter = 'PrecipTypePast24h'
     # # Filter based on failure time and time period
-    # precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
+    # precip_types = get_parameter_values(weather_parameter, station, ts, time_period, data)
 
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
     # Add temperture values to the precipitaion values
     precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
     # precip_data = precip_data.join(precip_types.rename('Type'))
@@ -763,37 +996,31 @@ def ColdRainGT10Days(station, ts, time_period='y'):
     # precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)]
     
     # Number of days of precip > 10 given temperature interval
-    if precip_values.size>0:
-        temperature_threshold = [.58, 2]
-        i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
-        precip_threshold = 10
-        value = (precip_data.loc[i_temperature,'Value']>precip_threshold).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = [.58, 2]
+    i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
+    precip_threshold = 10
+    value = aggregate(i_temperature & (precip_data['Value']>precip_threshold), ts, time_period, 'sum')
 
     return value
 
 
 # Nederbörd ( > 20 mm/dygn) när temperaturen ligger mellan 0.58 och 2 grader
-def ColdRainGT20Days(station, ts, time_period='y'):
+def ColdRainGT20Days(station, ts, time_period='y', data=None):
     # Dagar kraftig kall nederbörd  (ColdRainGT20Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-   # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
     # weather_parameter = 'PrecipTypePast24h'
     # # Filter based on failure time and time period
-    # precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
+    # precip_types = get_parameter_values(weather_parameter, station, ts, time_period, data)
 
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
     # Add temperture values to the precipitaion values
     precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
     # precip_data = precip_data.join(precip_types.rename('Type'))
@@ -801,36 +1028,30 @@ def ColdRainGT20Days(station, ts, time_period='y'):
     # precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)]
     
     # Number of days of precip > 20 given temperature interval
-    if precip_values.size>0:
-        temperature_threshold = [.58, 2]
-        i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
-        precip_threshold = 20
-        value = (precip_data.loc[i_temperature,'Value']>precip_threshold).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = [.58, 2]
+    i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
+    precip_threshold = 20
+    value = aggregate(i_temperature & (precip_data['Value']>precip_threshold), ts, time_period, 'sum')
 
     return value
 
 # Nederbörd när temperaturen ligger mellan -2 och 0.58 grader
-def WarmSnowDays(station, ts, time_period='y'):
+def WarmSnowDays(station, ts, time_period='y', data=None):
     # Dagar varm snö  (WarmSnowDays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
     # weather_parameter = 'PrecipTypePast24h'
     # # Filter based on failure time and time period
-    # precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
+    # precip_types = get_parameter_values(weather_parameter, station, ts, time_period, data)
 
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
     # Add temperture values to the precipitaion values
     precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
     # precip_data = precip_data.join(precip_types.rename('Type'))
@@ -838,36 +1059,30 @@ def WarmSnowDays(station, ts, time_period='y'):
     # precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)]
     
     # Days with precip given temperature interval
-    if precip_values.size>0:
-        temperature_threshold = [-2, .58]
-        i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
-        value = (precip_data.loc[i_temperature,'Value']>0).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = [-2, .58]
+    i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
+    value = aggregate(i_temperature & (precip_data['Value']>0), ts, time_period, 'sum')
 
     return value
 
 
 # Nederbörd (> 10 mm/dygn) när temperaturen ligger mellan -2 och 0.58 grader
-def WarmSnowGT10Days(station, ts, time_period='y'):
+def WarmSnowGT10Days(station, ts, time_period='y', data=None):
     # Dagar mkt varm snö  (WarmSnowGT10Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
     # weather_parameter = 'PrecipTypePast24h'
     # # Filter based on failure time and time period
-    # precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
+    # precip_types = get_parameter_values(weather_parameter, station, ts, time_period, data)
 
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
     # Add temperture values to the precipitaion values
     precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
     # precip_data = precip_data.join(precip_types.rename('Type'))
@@ -875,37 +1090,31 @@ def WarmSnowGT10Days(station, ts, time_period='y'):
     # precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)]
     
     # Number of days of precip > 10 given temperature interval
-    if precip_values.size>0:
-        temperature_threshold = [-2, .58]
-        i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
-        precip_threshold = 10
-        value = (precip_data.loc[i_temperature,'Value']>precip_threshold).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = [-2, .58]
+    i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
+    precip_threshold = 10
+    value = aggregate(i_temperature & (precip_data['Value']>precip_threshold), ts, time_period, 'sum')
 
     return value
 
 
 # Nederbörd (> 20 mm/dygn) när temperaturen ligger mellan -2 och 0.58 grader
-def WarmSnowGT20Days(station, ts, time_period='y'):
+def WarmSnowGT20Days(station, ts, time_period='y', data=None):
     # Dagar kraft varm snö  (WarmSnowGT20Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
     # weather_parameter = 'PrecipTypePast24h'
     # # Filter based on failure time and time period
-    # precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
+    # precip_types = get_parameter_values(weather_parameter, station, ts, time_period, data)
 
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
     # Add temperture values to the precipitaion values
     precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
     # precip_data = precip_data.join(precip_types.rename('Type'))
@@ -913,248 +1122,539 @@ def WarmSnowGT20Days(station, ts, time_period='y'):
     # precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)]
     
     # Number of days of precip > 20 given temperature interval
-    if precip_values.size>0:
-        temperature_threshold = [-2, .58]
-        i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
-        precip_threshold = 20
-        value = (precip_data.loc[i_temperature,'Value']>precip_threshold).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = [-2, .58]
+    i_temperature = (precip_data['Temperature']>temperature_threshold[0]) & (precip_data['Temperature']<temperature_threshold[1])
+    precip_threshold = 20
+    value = aggregate(i_temperature & (precip_data['Value']>precip_threshold), ts, time_period, 'sum')
 
     return value
 
 
 # Regn när temperaturen är under 2 grader
-def ColdPRRNdays(station, ts, time_period='y'):
+def ColdPRRNdays(station, ts, time_period='y', data=None):
     # Regn under 2 grader  (ColdPRRNdays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    # Add temperture values to the precipitaion values
-    precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
-    # Add precipitaion type
-    precip_data = precip_data.join(precip_types.rename('Type'))
-    # Filter out days with rain
-    valid_types = get_types('Rain')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)].groupby(level=0).first()
+    # Days with rain, temperature of the precipitation days
+    valid = has_type(precip_types, precip_values.index, 'Rain')
+    temperature = temperature_values.reindex(precip_values.index)
     
     # Number of days of rain given temperature interval
-    if precip_valid.size>0:
-        temperature_threshold = 2
-        i_temperature = precip_data['Temperature']<temperature_threshold
-        value = (precip_valid.loc[i_temperature,'Value']>0).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = 2
+    i_temperature = temperature<temperature_threshold
+    value = count_type_days(i_temperature & valid & (precip_values>0), valid, ts, time_period)
 
     return value
 
 
 # Regn ( > 10 mm/dygn) när temperaturen är under 2 grader
-def ColdPRRNgt10Days(station, ts, time_period='y'):
+def ColdPRRNgt10Days(station, ts, time_period='y', data=None):
     # Regn under 2 grader  (ColdPRRNgt10Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
-    # Add temperture values to the precipitaion values
-    precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
-    # Add precipitaion type
-    precip_data = precip_data.join(precip_types.rename('Type'))
-    # Filter out days with rain
-    valid_types = get_types('Rain')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)].groupby(level=0).first()
+    # Days with rain, temperature of the precipitation days
+    valid = has_type(precip_types, precip_values.index, 'Rain')
+    temperature = temperature_values.reindex(precip_values.index)
     
     # Number of days of rain more than 10 mm given temperature interval
-    if precip_valid.size>0:
-        temperature_threshold = 2
-        i_temperature = precip_valid['Temperature']<temperature_threshold
-        precip_threshold = 10
-        value = (precip_valid.loc[i_temperature,'Value']>precip_threshold).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = 2
+    i_temperature = temperature<temperature_threshold
+    precip_threshold = 10
+    value = count_type_days(i_temperature & valid & (precip_values>precip_threshold), valid, ts, time_period)
 
     return value
 
 # Regn ( > 20 mm/dygn) när temperaturen är under 2 grader
-def ColdPRRNgt20Days(station, ts, time_period='y'):
+def ColdPRRNgt20Days(station, ts, time_period='y', data=None):
     # Regn under 2 grader  (ColdPRRNgt20Days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
    
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    # Add temperture values to the precipitaion values
-    precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
-    # Add precipitaion type
-    precip_data = precip_data.join(precip_types.rename('Type'))
-    # Filter out days with rain
-    valid_types = get_types('Rain')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)].groupby(level=0).first()
+    # Days with rain, temperature of the precipitation days
+    valid = has_type(precip_types, precip_values.index, 'Rain')
+    temperature = temperature_values.reindex(precip_values.index)
     
     # Number of days of rain more than 20 mm given temperature threshold
-    if precip_valid.size>0:
-        temperature_threshold = 2
-        i_temperature = precip_valid['Temperature']<temperature_threshold
-        precip_threshold = 20
-        value = (precip_valid.loc[i_temperature,'Value']>precip_threshold).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = 2
+    i_temperature = temperature<temperature_threshold
+    precip_threshold = 20
+    value = count_type_days(i_temperature & valid & (precip_values>precip_threshold), valid, ts, time_period)
 
     return value
 
 
 # Snö när temperaturen är över -2 grader
-def WarmPRSNdays(station, ts, time_period='y'):
+def WarmPRSNdays(station, ts, time_period='y', data=None):
     # Snö över -2 grader  (WarmPRSNdays)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    # Add temperture values to the precipitaion values
-    precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
-    # Add precipitaion type
-    precip_data = precip_data.join(precip_types.rename('Type'))
-    # Filter out days with snow
-    valid_types = get_types('Snow')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)].groupby(level=0).first()
+    # Days with snow, temperature of the precipitation days
+    valid = has_type(precip_types, precip_values.index, 'Snow')
+    temperature = temperature_values.reindex(precip_values.index)
     
     # Number of days of rain given temperature interval
-    if precip_valid.size>0:
-        temperature_threshold = -2
-        i_temperature = precip_valid['Temperature']>temperature_threshold
-        value = (precip_valid.loc[i_temperature,'Value']>0).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = -2
+    i_temperature = temperature>temperature_threshold
+    value = count_type_days(i_temperature & valid & (precip_values>0), valid, ts, time_period)
 
     return value
 
 
 # Snö ( > 10 mm/dygn) när temperaturen är över -2 grader
-def WarmPRSNgt10days(station, ts, time_period='y'):
+def WarmPRSNgt10days(station, ts, time_period='y', data=None):
     # Snö över -2 grader  (WarmPRSNgt10days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
     
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
-    # Add temperture values to the precipitaion values
-    precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
-    # Add precipitaion type
-    precip_data = precip_data.join(precip_types.rename('Type'))
-    # Filter out days with snow
-    valid_types = get_types('Snow')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)].groupby(level=0).first()
+    # Days with snow, temperature of the precipitation days
+    valid = has_type(precip_types, precip_values.index, 'Snow')
+    temperature = temperature_values.reindex(precip_values.index)
     
     # Number of days of rain given temperature threshold
-    if precip_valid.size>0:
-        temperature_threshold = -2
-        i_temperature = precip_valid['Temperature']>temperature_threshold
-        precip_threshold = 10
-        value = (precip_valid.loc[i_temperature,'Value']>precip_threshold).sum()
-    else:
-        value = float('NaN')
+    temperature_threshold = -2
+    i_temperature = temperature>temperature_threshold
+    precip_threshold = 10
+    value = count_type_days(i_temperature & valid & (precip_values>precip_threshold), valid, ts, time_period)
 
     return value
 
 # Snö ( > 20 mm/dygn) när temperaturen är över -2 grader
-def WarmPRSNgt20days(station, ts, time_period='y'):
+def WarmPRSNgt20days(station, ts, time_period='y', data=None):
     # Snö över -2 grader  (WarmPRSNgt20days)
     # Input
     #   station         : station id [int]
-    #   ts              : timestamp
+    #   ts              : timestamp, or date range (start, end) for one value per time period
     #   time_period     : time period ('y'), default 'y'
+    #   data            : dict of pre-filtered values per weather parameter (optional)
 
-    weather_parameter = 'PrecipPast24hAt06'
-    # Filter based on failure time and time period
-    precip_values = smhi.get_values(weather_parameter, station, ts, time_period)
-    
-    weather_parameter = 'PrecipTypePast24h'
-    # Filter based on failure time and time period
-    precip_types = smhi.get_values(weather_parameter, station, ts, time_period)
-
-    weather_parameter = 'TemperaturePast24h'
-    # Filter based on failure time and time period
-    temperature_values = smhi.get_values(weather_parameter, station, ts, time_period)
+    weather_parameters = ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']
+    # Download concurrently and filter based on failure time and time period
+    precip_values, precip_types, temperature_values = get_parameter_values(weather_parameters, station, ts, time_period, data)
     
-    # Add temperture values to the precipitaion values
-    precip_data = precip_values.to_frame().join(temperature_values.rename('Temperature'))
-    # Add precipitaion type
-    precip_data = precip_data.join(precip_types.rename('Type'))
-    # Filter out days with snow
-    valid_types = get_types('Snow')
-    precip_valid = precip_data.loc[precip_data['Type'].isin(valid_types)].groupby(level=0).first()
+    # Days with snow, temperature of the precipitation days
+    valid = has_type(precip_types, precip_values.index, 'Snow')
+    temperature = temperature_values.reindex(precip_values.index)
     
     # Number of days of rain given temperature interval
-    if precip_valid.size>0:
-        temperature_threshold = -2
-        i_temperature = precip_valid['Temperature']>temperature_threshold
-        precip_threshold = 20
-        value = (precip_valid.loc[i_temperature,'Value']>precip_threshold).sum()
+    temperature_threshold = -2
+    i_temperature = temperature>temperature_threshold
+    precip_threshold = 20
+    value = count_type_days(i_temperature & valid & (precip_values>precip_threshold), valid, ts, time_period)
+
+    return value
+
+
+#%% Batch calculation
+
+# Indicators sharing the vegperiods of the same values in data (see get_veg_season)
+veg_season_functions = [VegSeasonDayEnd, VegSeasonDayStart, VegSeasonLentgh]
+
+# Function, keyword arguments and weather parameters of the indicators (see indicators.json)
+indicator_functions = {
+    'TAS' : (TAS, {}, ['TemperatureMeanPastMonth']),
+    'TX' : (TX, {}, ['TemperatureMaxPast24h']),
+    'TN' : (TN, {}, ['TemperatureMinPast24h']),
+    'DTR' : (DTR, {}, ['TemperatureMinPast24h', 'TemperatureMaxPast24h']),
+    'WarmDays' : (WarmDays, {}, ['TemperatureMaxPast24h']),
+    'ConWarmDays' : (ConWarmDays, {}, ['TemperatureMaxPast24h']),
+    'ZeroCrossingDays' : (ZeroCrossingDays, {}, ['TemperatureMinPast24h', 'TemperatureMaxPast24h']),
+    'VegSeasonDayEnd-5' : (VegSeasonDayEnd, {}, ['TemperaturePast24h']),
+    'VegSeasonDayStart-5' : (VegSeasonDayStart, {}, ['TemperaturePast24h']),
+    'VegSeasonLentgh-5' : (VegSeasonLentgh, {'temperature' : 5}, ['TemperaturePast24h']),
+    'VegSeasonLentgh-2' : (VegSeasonLentgh, {'temperature' : 2}, ['TemperaturePast24h']),
+    'FrostDays' : (FrostDays, {}, ['TemperatureMinPast24h']),
+    'ColdDays' : (ColdDays, {}, ['TemperatureMaxPast24h']),
+    'PR' : (PR, {}, ['PrecipPast24hAt06']),
+    'PRRN' : (PRRN, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h']),
+    'PRSN' : (PRSN, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h']),
+    'SuperCooledPR' : (SuperCooledPR, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h']),
+    'PR7Dmax' : (PR7Dmax, {}, ['PrecipPast24hAt06']),
+    'Prmax' : (PRmax, {}, ['PrecipPast24hAt06']),
+    'PRSNmax' : (PRSNmax, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h']),
+    'PRgt10Days' : (PRgt10Days, {}, ['PrecipPast24hAt06']),
+    'PRgt25Days' : (PRgt25Days, {}, ['PrecipPast24hAt06']),
+    'DryDays' : (DryDays, {}, ['PrecipPast24hAt06']),
+    'LnstDryDays' : (None, {}, ['PrecipPast24hAt06']),
+    'SncDays' : (SncDays, {}, ['SnowDepthPast24h']),
+    'SNWmax' : (SNWmax, {}, ['SnowDepthPast24h']),
+    'SfcWind' : (SfcWind, {}, ['WindSpeed']),
+    'WindGustMax' : (WindGustMax, {}, ['WindGust']),
+    'WindyDays' : (WindyDays, {}, ['WindGust']),
+    'ColdRainDays' : (ColdRainDays, {}, ['PrecipPast24hAt06', 'TemperaturePast24h']),
+    'ColdRainGT10Days' : (ColdRainGT10Days, {}, ['PrecipPast24hAt06', 'TemperaturePast24h']),
+    'ColdRainGT20Days' : (ColdRainGT20Days, {}, ['PrecipPast24hAt06', 'TemperaturePast24h']),
+    'WarmSnowDays' : (WarmSnowDays, {}, ['PrecipPast24hAt06', 'TemperaturePast24h']),
+    'WarmSnowGT10Days' : (WarmSnowGT10Days, {}, ['PrecipPast24hAt06', 'TemperaturePast24h']),
+    'WarmSnowGT20Days' : (WarmSnowGT20Days, {}, ['PrecipPast24hAt06', 'TemperaturePast24h']),
+    'ColdPRRNdays' : (ColdPRRNdays, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']),
+    'ColdPRRNgt10Days' : (ColdPRRNgt10Days, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']),
+    'ColdPRRNgt20Days' : (ColdPRRNgt20Days, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']),
+    'WarmPRSNdays' : (WarmPRSNdays, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']),
+    'WarmPRSNgt10Days' : (WarmPRSNgt10days, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']),
+    'WarmPRSNgt20Days' : (WarmPRSNgt20days, {}, ['PrecipPast24hAt06', 'PrecipTypePast24h', 'TemperaturePast24h']),
+    }
+
+# Indicators that are sums or threshold counts of one weather parameter over the time window,
+# calculated from a WindowIndex per station in calc_events: (weather parameter, threshold)
+# with threshold None for the sum of values, or (comparison, value) for the number of days
+window_sums = {
+    'WarmDays' : ('TemperatureMaxPast24h', ('>', 20)),
+    'FrostDays' : ('TemperatureMinPast24h', ('<', 0)),
+    'ColdDays' : ('TemperatureMaxPast24h', ('<', -7)),
+    'PR' : ('PrecipPast24hAt06', None),
+    'PRgt10Days' : ('PrecipPast24hAt06', ('>', 10)),
+    'PRgt25Days' : ('PrecipPast24hAt06', ('>', 25)),
+    'DryDays' : ('PrecipPast24hAt06', ('<', 1)),
+    'SncDays' : ('SnowDepthPast24h', ('>', 0)),
+    }
+
+# Indicators that are the max or min of one weather parameter over the time window, from the
+# sparse tables of a WindowIndex in calc_events: (weather parameter, 'max' or 'min'). The 
+# daily max of the hourly wind parameters has the same max as the hourly values.
+window_extremes = {
+    'TX' : ('TemperatureMaxPast24h', 'max'),
+    'TN' : ('TemperatureMinPast24h', 'min'),
+    'Prmax' : ('PrecipPast24hAt06', 'max'),
+    'SNWmax' : ('SnowDepthPast24h', 'max'),
+    'SfcWind' : ('WindSpeed', 'max'),
+    'WindGustMax' : ('WindGust', 'max'),
+    }
+
+# Indicators that are the longest run of days in a row over a threshold in the time window, 
+# from a RunIndex per station in calc_events: (weather parameter, (comparison, value))
+window_runs = {
+    'ConWarmDays' : ('TemperatureMaxPast24h', ('>', 20)),
+    }
+
+def get_indicators(indicators='all'):
+    # Validated indicator names (all implemented indicators if 'all')
+    implemented = [name for name, (func, _, _) in indicator_functions.items() if func is not None]
+    if isinstance(indicators, str):
+        if indicators.lower() == 'all':
+            return implemented
+        indicators = [indicators]
+    return [validatestring(indicator, implemented) for indicator in indicators]
+
+def get_weather_parameters(indicators='all'):
+    # Union of weather parameters needed for the indicators
+    parameters = []
+    for indicator in get_indicators(indicators):
+        parameters += indicator_functions[indicator][2]
+    return list(dict.fromkeys(parameters))
+
+def type_masks(archives):
+    # Archives of precipitation types as daily type masks, keys (param id, station, idx)
+    type_ids = [smhi.get_param_value(param) for param in type_parameters]
+    return {key : get_type_mask_frame(archive, key[2]) if key[0] in type_ids and archive is not None else archive 
+            for key, archive in archives.items()}
+
+def get_period(indicator, time_period=None):
+    # Time period, default is the default of the indicator
+    if time_period is None:
+        return inspect.signature(indicator_functions[indicator][0]).parameters['time_period'].default
+    return time_period
+
+def get_result_key(indicator, station, ts, time_period, direction=None):
+    # Key of an indicator result in the result cache (see results.py): indicator, station, 
+    # ts and its time window resolved by helpers.get_filter
+    if is_range(ts):
+        ts = [t if isinstance(t, str) else t.isoformat() for t in ts]
+        window = period_rules.get(time_period, time_period)
     else:
-        value = float('NaN')
+        window = get_filter(ts, time_period, direction)
+        ts = ts if isinstance(ts, str) else ts.isoformat()
+    return json.dumps([indicator, int(station), ts, str(window)])
+
+def get_data_version(indicator, station):
+    # Update timestamps of the weather parameters of an indicator at station (station list only)
+    return json.dumps([str(smhi.get_updated(smhi.get_param_value(param), station)) 
+                       for param in indicator_functions[indicator][2]])
+
+def calc(indicators='all', station=None, ts=None, time_period=None, cases=None, use_cache=False):
+    # Calculate several indicators for one or more (station, ts, time_period), 
+    # each weather parameter is downloaded once per station
+    # Input
+    #   indicators      : list of indicator names, default 'all'
+    #   station         : station id [int]
+    #   ts              : timestamp, or date range (start, end) for one row per time period
+    #   time_period     : time period, default is the default of each indicator
+    #   cases           : list of (station, ts, time_period), replaces station, ts, time_period
+    #   use_cache       : reuse results calculated from the same data version (see results.py),
+    #                     only stations with results not cached are loaded
+    # Output
+    #   DataFrame with columns station, ts, time_period, indicator, value
+    indicators = get_indicators(indicators)
+    if cases is None:
+        cases = [(station, ts, time_period)]
+    
+    # Results in the result cache
+    keys = {}
+    cached = {}
+    if use_cache:
+        for i, (station, ts, time_period) in enumerate(cases):
+            for indicator in indicators:
+                keys[(i, indicator)] = (get_result_key(indicator, station, ts, get_period(indicator, time_period)), 
+                                        get_data_version(indicator, station))
+        found = results.get_results(list(keys.values()))
+        cached = {item : found[key] for item, (key, _) in keys.items() if key in found}
+    
+    # Load all weather parameters for all stations once, hourly parameters as their 
+    # daily aggregates if all time windows are whole days. Parameters in the store or 
+    # a cube are sliced for each case instead.
+    todo = [(case, indicator) for i, case in enumerate(cases) for indicator in indicators if (i, indicator) not in cached]
+    parameters = get_weather_parameters(list(dict.fromkeys(indicator for _, indicator in todo)))
+    stations = list(dict.fromkeys(case[0] for case, _ in todo))
+    sliced = {(param, station) for station in stations for param in parameters if is_sliced(param, station)}
+    daily = [param for param in parameters if param in daily_aggregates and 
+             all(is_daily(ts, get_period(indicator, time_period)) for (_, ts, time_period), indicator in todo 
+                 if param in indicator_functions[indicator][2])]
+    archives = smhi.get_many([(smhi.get_param_value(param), station, parameter_index.get(param, 'Date')) 
+                              for station in stations for param in parameters 
+                              if param not in daily and (param, station) not in sliced], 
+                             func=smhi.get_indexed, errors='ignore')
+    archives = type_masks(archives)
+    dailies = smhi.get_many([(smhi.get_param_value(param), station) for station in stations for param in daily 
+                             if (param, station) not in sliced], 
+                            func=smhi.get_daily, errors='ignore')
+    archives.update({(param, station, 'Date') : df for (param, station), df in dailies.items()})
+    # Failed downloads (logged by get_many), their indicators are NaN without downloading again
+    failed = {(param, station) for (param, station, _), archive in archives.items() if archive is None}
+    
+    rows = []
+    calculated = []
+    for i, (station, ts, time_period) in enumerate(cases):
+        # Filtered values per (weather parameter, time period), shared by the indicators
+        filtered = {}
+        for indicator in indicators:
+            func, kwargs, weather_parameters = indicator_functions[indicator]
+            period = get_period(indicator, time_period)
+            if (i, indicator) in cached:
+                value = cached[(i, indicator)]
+            elif any((smhi.get_param_value(param), station) in failed for param in weather_parameters):
+                value = float('NaN')
+            else:
+                try:
+                    data = {}
+                    for param in weather_parameters:
+                        if (param, period) not in filtered:
+                            if (param, station) in sliced:
+                                idx, col, archive = parameter_index.get(param, 'Date'), 'Value', None
+                            elif param in daily:
+                                idx, col = 'Date', daily_aggregates[param]
+                                archive = archives[(smhi.get_param_value(param), station, idx)]
+                            else:
+                                idx, col = parameter_index.get(param, 'Date'), 'Value'
+                                archive = archives[(smhi.get_param_value(param), station, idx)]
+                            param_values = smhi.get_values(param, station, ts, period, idx=idx, col=col, data=archive)
+                            if archive is None and param in type_parameters:
+                                param_values = get_type_mask(param_values)
+                            filtered[(param, period)] = param_values
+                        data[param] = filtered[(param, period)]
+                    if func in veg_season_functions:
+                        data['VegSeasons'] = filtered.setdefault(('VegSeasons', period), {})
+                    value = func(station, ts, time_period=period, data=data, **kwargs)
+                    if use_cache:
+                        calculated.append(keys[(i, indicator)] + (value,))
+                except Exception as e:
+                    logging.warning('%s failed for station %s at %s: %s' % (indicator, station, ts, e))
+                    value = float('NaN')
+            if isinstance(value, pd.Series):
+                # Date range, one row per time period
+                rows += [(station, start, period, indicator, v) for start, v in value.items()]
+            else:
+                rows.append((station, ts, period, indicator, value))
+    # Failed calculations are not cached
+    results.put_results(calculated)
+    
+    return pd.DataFrame(rows, columns=['station', 'ts', 'time_period', 'indicator', 'value'])
 
-    return value
\ No newline at end of file
+def window_indicators(indexed, timestamps, periods, direction=None):
+    # Indicators of window_sums, window_extremes and window_runs for all timestamps of a 
+    # station from a WindowIndex of each weather parameter and a RunIndex of each threshold, 
+    # a few lookups per timestamp
+    # Input
+    #   indexed         : archives of the station indexed by index_time, per weather parameter
+    #   timestamps      : timestamps
+    #   periods         : time period of each (indicator, window)
+    # Output
+    #   dict of value by (ts, indicator, window), only timestamps with data available at ts
+    #   (others are filtered as in filter_time and calculated by the indicator function)
+    values = {}
+    indexes = {}
+    runs = {}
+    positions = {}
+    for (indicator, window), period in periods.items():
+        if indicator in window_sums:
+            param, threshold = window_sums[indicator]
+        elif indicator in window_extremes:
+            param, func = window_extremes[indicator]
+        elif indicator in window_runs:
+            param, threshold = window_runs[indicator]
+        else:
+            continue
+        if param not in indexed:
+            continue
+        df = set_index(indexed[param], parameter_index.get(param, 'Date'))
+        if not is_sorted_time(df):
+            continue
+        if param not in indexes:
+            indexes[param] = WindowIndex(df['Value'].values)
+        if (param, period) not in positions:
+            try:
+                positions[(param, period)] = window_positions(df.index.values, timestamps, period, direction)
+            except Exception:
+                # Calculated by the indicator function
+                continue
+        i1, i2, observed = positions[(param, period)]
+        if indicator in window_runs:
+            if (param, threshold) not in runs:
+                with np.errstate(invalid='ignore'):
+                    mask = WindowIndex.comparisons[threshold[0]](indexes[param].values, threshold[1])
+                runs[(param, threshold)] = RunIndex(mask)
+            result = runs[(param, threshold)].longest(i1, i2)
+        elif indicator in window_extremes:
+            result = indexes[param].extreme(func, i1, i2)
+        elif threshold is None:
+            result = indexes[param].sum(i1, i2)
+        else:
+            result = indexes[param].count(threshold[0], threshold[1], i1, i2)
+        values.update({(ts, indicator, window) : result[k] for k, ts in enumerate(timestamps) if observed[k]})
+    return values
+
+def calc_events(events, indicators='all', windows=None, direction=None, station_col='station', ts_col='ts', 
+                use_index=True):
+    # Calculate indicators for a table of events, e.g. failures (asset, station, failure time),
+    # the weather parameters of each station are downloaded and indexed once
+    # Input
+    #   events          : DataFrame with station and timestamp columns
+    #   indicators      : list of indicator names, default 'all'
+    #   windows         : time period or list of time periods ('m','s','y','-7days',...), 
+    #                     default is the default of each indicator
+    #   direction       : 'backward' or 'forward' from the timestamp, see helpers.get_filter
+    #   station_col     : name of station column, default 'station'
+    #   ts_col          : name of timestamp column, default 'ts'
+    #   use_index       : sums, threshold counts, extremes and runs (window_sums, window_extremes, 
+    #                     window_runs) from indexes of the station series instead of filtering 
+    #                     each time window, default True
+    # Output
+    #   events with one column per indicator and window (indicator_window if several windows)
+    indicators = get_indicators(indicators)
+    if windows is None or isinstance(windows, str):
+        windows = [windows]
+    
+    # Output columns
+    columns = {}
+    for indicator in indicators:
+        for window in windows:
+            if len(windows)>1:
+                columns[(indicator, window)] = '%s_%s' % (indicator, window)
+            else:
+                columns[(indicator, window)] = indicator
+    column_values = {column : {} for column in columns.values()}
+    
+    # Time period of each indicator and window, default time period of the indicator
+    periods = {(indicator, window) : get_period(indicator, window) for indicator, window in columns}
+    
+    parameters = get_weather_parameters(indicators)
+    for station, group in events.groupby(station_col, sort=False):
+        # Download the weather parameters of the station concurrently, indexed once
+        archives = smhi.get_many([(smhi.get_param_value(param), station, parameter_index.get(param, 'Date')) 
+                                  for param in parameters], func=smhi.get_indexed, errors='ignore')
+        archives = type_masks(archives)
+        indexed = {}
+        for param in parameters:
+            archive = archives[(smhi.get_param_value(param), station, parameter_index.get(param, 'Date'))]
+            if archive is not None:
+                indexed[param] = archive
+        del archives
+        
+        # Events of the station at the same timestamp are only calculated once
+        timestamps = list(dict.fromkeys(group[ts_col]))
+        values = window_indicators(indexed, timestamps, periods, direction) if use_index else {}
+        # Failed downloads (logged by get_many), their indicators are NaN without downloading again
+        for indicator, window in columns:
+            if any(param not in indexed for param in indicator_functions[indicator][2]):
+                values.update({(ts, indicator, window) : float('NaN') for ts in timestamps})
+        
+        # Filter all timestamps of the station at once for each weather parameter and time period
+        # (not needed for the indicators calculated from window indexes)
+        filtered = {}
+        for param in indexed:
+            for (indicator, window), period in periods.items():
+                if param not in indicator_functions[indicator][2] or (param, timestamps[0], period) in filtered:
+                    continue
+                if use_index and (timestamps[0], indicator, window) in values:
+                    continue
+                try:
+                    filtered.update(zip([(param, ts, period) for ts in timestamps], 
+                                        filter_times(indexed[param], timestamps, period, parameter_index.get(param, 'Date'), 
+                                                     'Value', direction=direction)))
+                except Exception:
+                    # Filtered for each event below
+                    pass
+        
+        for event, ts in group[ts_col].items():
+            for (indicator, window), column in columns.items():
+                if (ts, indicator, window) not in values:
+                    func, kwargs, weather_parameters = indicator_functions[indicator]
+                    period = periods[(indicator, window)]
+                    try:
+                        data = {}
+                        for param in weather_parameters:
+                            if (param, ts, period) not in filtered:
+                                filtered[(param, ts, period)] = smhi.get_values(param, station, ts, period, 
+                                                                                idx=parameter_index.get(param, 'Date'), 
+                                                                                direction=direction, data=indexed[param])
+                            data[param] = filtered[(param, ts, period)]
+                        if func in veg_season_functions:
+                            data['VegSeasons'] = filtered.setdefault(('VegSeasons', ts, period), {})
+                        value = func(station, ts, time_period=period, data=data, **kwargs)
+                    except Exception as e:
+                        logging.warning('%s failed for station %s at %s: %s' % (indicator, station, ts, e))
+                        value = float('NaN')
+                    values[(ts, indicator, window)] = value
+                column_values[column][event] = values[(ts, indicator, window)]
+    
+    df_output = events.copy()
+    for column, result in column_values.items():
+        df_output[column] = pd.Series(result, dtype=None if len(result)>0 else float)
+    
+    return df_output
@@ -0,0 +1,138 @@
+import smhi
+import json
+import logging
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Memory-mapped cube of one hourly parameter for many stations, a station x hour float32
+# matrix with NaN where there are no observations (<CUBE_DIR>/<param>.f32), and its
+# stations, first hour and update timestamps (<CUBE_DIR>/<param>.json).
+# Rows are contiguous so a time window of a station is read without loading the cube.
+
+# Index column of hourly timestamps, as in the corrected archives
+TIME_COLUMN = 'Date (UTC)'
+# Decimals values are rounded to when read back from float32 (SMHI values have at most 2)
+VALUE_DECIMALS = 3
+
+# Opened cubes per parameter, reopened if the files change
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+def get_cube_path(param):
+    # Data and info files of cube (None if cubes are disabled)
+    if not smhi.CUBE_DIR:
+        return None
+    path = os.path.join(smhi.CUBE_DIR, str(param))
+    return path + '.f32', path + '.json'
+
+def build_cube(param, stations=None, start=None, end=None):
+    # Build cube from corrected archives, downloading smhi.MAX_WORKERS stations at a time
+    # Input
+    #   param           : hourly weather parameter
+    #   stations        : station ids, default all stations of parameter
+    #   start, end      : first and last hour, default first and last of the stations
+    param = smhi.get_param_value(param)
+    paths = get_cube_path(param)
+    if paths is None:
+        raise ValueError('smhi.CUBE_DIR is not set')
+    df_stations = smhi.list_stations(param)
+    if stations is not None:
+        df_stations = df_stations[df_stations['id'].isin(stations)]
+    stations = df_stations['id'].tolist()
+    start = (df_stations['from'].min() if start is None else pd.Timestamp(start)).floor('h')
+    end = (df_stations['to'].max() if end is None else pd.Timestamp(end)).ceil('h')
+    hours = int((end - start) / pd.Timedelta(hours=1)) + 1
+    updated = dict(zip(df_stations['id'], df_stations['updated']))
+
+    os.makedirs(smhi.CUBE_DIR, exist_ok=True)
+    # write to temporary files first so an interrupted build never leaves a broken cube
+    tmp_paths = ['%s.%d.tmp' % (path, threading.get_ident()) for path in paths]
+    values = np.memmap(tmp_paths[0], dtype='float32', mode='w+', shape=(len(stations), hours))
+    for i in range(0, len(stations), smhi.MAX_WORKERS):
+        chunk = stations[i:i+smhi.MAX_WORKERS]
+        archives = smhi.get_many([(param, station) for station in chunk], func=smhi.get_corrected, errors='ignore')
+        for j, station in enumerate(chunk, i):
+            row = np.full(hours, np.nan, dtype='float32')
+            df = archives.get((param, station))
+            if df is None:
+                logging.warning('No data for station %s in cube of parameter %s' % (station, param))
+            else:
+                h = (df[TIME_COLUMN].values - start.to_datetime64()) // np.timedelta64(1, 'h')
+                inside = (h >= 0) & (h < hours)
+                row[h[inside]] = df['Value'].values[inside]
+            values[j] = row
+    values.flush()
+    del values
+
+    info = {'stations' : stations,
+            'start' : start.isoformat(),
+            'hours' : hours,
+            'updated' : [None if pd.isna(updated[station]) else str(updated[station]) for station in stations]}
+    with open(tmp_paths[1], 'w') as f:
+        json.dump(info, f)
+    os.replace(tmp_paths[0], paths[0])
+    os.replace(tmp_paths[1], paths[1])
+
+def open_cube(param):
+    # Cube of parameter (None if not built)
+    # Output
+    #   values          : read-only memmap station x hour float32 matrix
+    #   stations        : station ids of rows
+    #   rows            : row of each station id
+    #   start           : first hour (datetime64)
+    #   updated         : update timestamp of each station when cube was built
+    param = smhi.get_param_value(param)
+    paths = get_cube_path(param)
+    if paths is None or not os.path.isfile(paths[1]):
+        return None
+    mtime = os.path.getmtime(paths[1])
+    with _cubes_lock:
+        cube = _cubes.get(param)
+        if cube is not None and cube[0] == mtime:
+            return cube[1]
+        with open(paths[1]) as f:
+            info = json.load(f)
+        values = np.memmap(paths[0], dtype='float32', mode='r', shape=(len(info['stations']), info['hours']))
+        cube = {'values' : values,
+                'stations' : info['stations'],
+                'rows' : {station : i for i, station in enumerate(info['stations'])},
+                'start' : np.datetime64(info['start'], 'h'),
+                'updated' : info['updated']}
+        _cubes[param] = (mtime, cube)
+        return cube
+
+def has_station(param, station):
+    # True if station is in the cube of parameter and not updated since the cube was built
+    cube = open_cube(param)
+    if cube is None or station not in cube['rows']:
+        return False
+    updated = smhi.get_updated(param, station)
+    return cube['updated'][cube['rows'][station]] == (None if updated is None else str(updated))
+
+def get_slice(param, start=None, end=None, stations=None):
+    # Hours from start to end of a cube, as views of the memmap (not loaded until used)
+    # Output
+    #   values          : station x hour matrix
+    #   stations        : station ids of rows
+    #   times           : hourly DatetimeIndex of columns
+    cube = open_cube(param)
+    if cube is None:
+        raise ValueError('No cube of parameter %s' % param)
+    hours = cube['values'].shape[1]
+    i1 = 0 if start is None else int(np.clip((np.datetime64(pd.Timestamp(start).ceil('h'), 'h') - cube['start']).astype('int64'), 0, hours))
+    i2 = hours if end is None else int(np.clip((np.datetime64(pd.Timestamp(end).floor('h'), 'h') - cube['start']).astype('int64') + 1, i1, hours))
+    times = pd.date_range(pd.Timestamp(cube['start'] + i1), periods=i2-i1, freq='h', name=TIME_COLUMN)
+    if stations is None:
+        return cube['values'][:, i1:i2], cube['stations'], times
+    rows = [cube['rows'][station] for station in stations]
+    return cube['values'][rows, i1:i2], list(stations), times
+
+def get_cube_values(param, station, start=None, end=None):
+    # Observations of station from start to end, as smhi.get_indexed (indexed by TIME_COLUMN)
+    values, _, times = get_slice(param, start, end, [station])
+    values = np.asarray(values[0])
+    observed = ~np.isnan(values)
+    values = np.round(values[observed].astype('float64'), VALUE_DECIMALS)
+    return pd.DataFrame({'Value' : values}, index=times[observed])
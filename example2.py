@@ -25,13 +25,14 @@ station_name = stations.set_index('id').loc[station,'name']
 print(station_name)
 
 #%% Valid parameters for station
+# Check if data available for all parameters for station at once
+isin = smhi.isin_stations(parameters['key'].tolist(), [station], ts=ts[0])
 valid_parameters = []
 for idx, row in parameters.iterrows():
     param_id = row['key']
     param = row['label']
 
-    # Check if data available for parameter for station
-    if smhi.isin_station(param_id, station, ts=ts[0]):
+    if isin.loc[station, param_id]:
          print('%s (id=%d) is avalable in station %s (id=%d)' % (param, param_id, station_name, station))
          valid_parameters.append(param)
     else:
@@ -42,31 +43,18 @@ df_list = []
 parameter_list = []
 for param in valid_parameters:
     param_id = smhi.get_param_value(param)    
-    if param in ['TemperaturePast1h']:
-        values = smhi.get_values(param_id, station, ts, idx='Date (UTC)', col=None) 
+    if param in ['TemperaturePast1h', 'PrecipPast12h', 'SnowDepthPast24h']:
+        # Corrected archive and the latest months (not yet in the archive)
+        data = smhi.get_refreshed(param_id, station)
+        values = smhi.get_values(param_id, station, ts, idx='Date (UTC)', col=None, data=data)
         df = values.reset_index().reindex(columns=['Date', 'Date (UTC)', 'Value', 'Quality'])
-        if df['Date (UTC)'].max()<pd.to_datetime(ts[1]):
-            values = smhi.get_latest_months(param_id, station)
-            values['Date'] = values['Date (UTC)'].dt.date
-            df = pd.merge(df, values, on=df.columns.tolist(), how='outer')
-        
-    elif param in ['PrecipPast12h', 'SnowDepthPast24h']:
-        values = smhi.get_values(param_id, station, ts, idx='Date (UTC)', col=None)        
-        df = values.reset_index().reindex(columns=['Date', 'Date (UTC)', 'Value', 'Quality'])
-        if df['Date (UTC)'].max()<pd.to_datetime(ts[1]):
-            values = smhi.get_latest_months(param_id, station)
-            values['Date'] = values['Date (UTC)'].dt.date
-            df = pd.merge(df, values, on=df.columns.tolist(), how='outer')
         
     elif param in ['PrecipPast24hAt06']:
-        values = smhi.get_values(param_id, station, ts, idx='Date', col=None) 
+        data = smhi.get_refreshed(param_id, station)
+        values = smhi.get_values(param_id, station, ts, idx='Date', col=None, data=data) 
         df = values.reset_index().reindex(columns=['Date', 'From Date (UTC)', 'To Date (UTC)', 'Value', 'Quality'])
         df['Date'] = df['Date'].dt.date
         
-        if df['From Date (UTC)'].max()<pd.to_datetime(ts[1]):
-            values = smhi.get_latest_months(param_id, station) 
-            df = pd.merge(df, values, on=df.columns.tolist(), how='outer')
-        
     else:
         values = None
     if values is not None:
@@ -2,13 +2,64 @@ import datetime
 # import sys
 # import logging
 import json
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+
+# -- http session
+# Settings of the session shared by all requests to the SMHI API
+HTTP_POOL_SIZE = 10         # max connections kept alive per host
+HTTP_TIMEOUT = (10, 300)    # connect and read timeout in seconds
+HTTP_RETRIES = 3            # retries on connection errors
+HTTP_HEADERS = {'Accept-Encoding' : 'gzip, deflate'}
+
+_session = None
+_session_lock = threading.Lock()
 
 
 # functions
+def get_session():
+    # Shared requests session with keep-alive connection pool
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=HTTP_RETRIES)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(HTTP_HEADERS)
+            _session = session
+    return _session
+
+def configure_session(pool_size=None, timeout=None, retries=None, headers=None):
+    # Change session settings, the session is recreated on next request
+    global HTTP_POOL_SIZE, HTTP_TIMEOUT, HTTP_RETRIES, HTTP_HEADERS
+    if pool_size is not None:
+        HTTP_POOL_SIZE = pool_size
+    if timeout is not None:
+        HTTP_TIMEOUT = timeout
+    if retries is not None:
+        HTTP_RETRIES = retries
+    if headers is not None:
+        HTTP_HEADERS = dict(HTTP_HEADERS, **headers)
+    close_session()
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def http_get(adr):
+    # GET request using the shared session, raises HTTPError on error status
+    response = get_session().get(adr, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response
+
 def api_return_data(adr):
     # initiate the call
-    req_obj = requests.get(adr)
+    req_obj = http_get(adr)
     # try to get the json data (exceptions will be catched later)
     json_data = req_obj.json()
     return json_data
@@ -164,23 +215,107 @@ def get_filter(ts, time_period='day', direction=None):
             
     return time_filter
 
-def get_types(cat):
-    PrecitipationTypes = ['snowfall',
-                'regn',
-                'duggregn',
-                'regnskurar',
-                'kornsnö',
-                'snöblandat regn',
-                'snöbyar',
-                'Obestämd nederbördstyp',
-                'isnålar',
-                'underkyld nederbörd',
-                'iskorn',
-                'småhagel',
-                'byar av snöblandat regn',
-                'snöhagel',
-                'ishagel']
+def get_filters(ts, time_period='day', direction=None):
+    # Time windows of get_filter for many timestamps at once
+    # Input
+    #   ts              : timestamps (DatetimeIndex or list)
+    #   time_period     : time period as in get_filter ('day','week','month','season','year',
+    #                     '-7days', timedelta)
+    #   direction       : 'backward' or 'forward', default None
+    # Output
+    #   starts, ends    : datetime64[ns] arrays of first and last time of each window, 
+    #                     as slicing with the strings of get_filter
+    import numpy as np
+    from pandas import DatetimeIndex, to_timedelta
+    times = DatetimeIndex(ts).values
+    ns = np.timedelta64(1, 'ns')
+    # get_filter returns timestamps as iso strings with second resolution
+    second = np.timedelta64(1, 's')
+    
+    def pad(t):
+        # last time of the second of t (t itself if it has fractions of a second)
+        return t + np.where(t.astype('int64') % 1000000000 == 0, second-ns, np.timedelta64(0, 'ns'))
+    
+    def month_start(months):
+        return months.astype('datetime64[M]').astype('datetime64[ns]')
+    
+    # Months since 1970 and month of year (0 is January)
+    months = times.astype('datetime64[M]').astype('int64')
+    month_of_year = months % 12
+    # First month of the season, Dec-Feb start in December
+    season_start = months - (month_of_year-2) % 3
+    
+    if isinstance(time_period, str):
+        try:
+            time_period = to_timedelta(time_period)
+        except ValueError:
+            time_period = validatestring(time_period, ['day','week','month','season','year'], only_forward=True)
+    
+    if direction is None:
+        if not isinstance(time_period, str):
+            time_period = np.timedelta64(to_timedelta(time_period))
+            starts = np.minimum(times, times+time_period)
+            ends = pad(np.maximum(times, times+time_period))
+        elif time_period == 'day':
+            days = times.astype('datetime64[D]')
+            starts = days.astype('datetime64[ns]')
+            ends = (days+1).astype('datetime64[ns]')-ns
+        elif time_period == 'week':
+            # Monday to Sunday (1970-01-01 was a Thursday)
+            days = times.astype('datetime64[D]')
+            days = days - (days.astype('int64')+3) % 7
+            starts = days.astype('datetime64[ns]')
+            ends = (days+7).astype('datetime64[ns]')-ns
+        elif time_period == 'month':
+            starts = month_start(months)
+            ends = month_start(months+1)-ns
+        elif time_period == 'season':
+            # as get_filter, December belongs to the season of the following Jan-Feb
+            first = season_start - np.where(month_of_year == 11, 12, 0)
+            starts = month_start(first)
+            ends = month_start(first+3)-ns
+        else:
+            years = times.astype('datetime64[Y]')
+            starts = years.astype('datetime64[ns]')
+            ends = (years+1).astype('datetime64[ns]')-ns
+    
+    else:
+        direction = validatestring(direction, ['backward', 'forward'], only_forward=True)
+        if isinstance(time_period, str):
+            if time_period == 'season':
+                # Window to the first day of the last month (forward) or from the start of the season
+                if direction == 'forward':
+                    return times, pad(month_start(season_start+2))
+                return month_start(season_start), pad(times)
+            time_period = {'day' : '1d', 'week' : '1w', 'month' : '31d', 'year' : '365d'}[time_period]
+        time_period = np.timedelta64(to_timedelta(time_period))
+        if direction == 'forward':
+            starts = times
+            ends = pad(times+time_period)
+        else:
+            starts = times-time_period
+            ends = pad(times)
     
+    return starts, ends
+
+# Vocabulary of precipitation types, one bit per type in the daily type masks (get_type_mask)
+precipitation_types = ['snowfall',
+            'regn',
+            'duggregn',
+            'regnskurar',
+            'kornsnö',
+            'snöblandat regn',
+            'snöbyar',
+            'Obestämd nederbördstyp',
+            'isnålar',
+            'underkyld nederbörd',
+            'iskorn',
+            'småhagel',
+            'byar av snöblandat regn',
+            'snöhagel',
+            'ishagel']
+
+def get_types(cat):
     if cat.lower()=='rain':
         return ['regn', 'duggregn', 'regnskurar']
     elif cat.lower()=='snow':
@@ -192,7 +327,146 @@ def get_types(cat):
     else: 
         return []
     
+def get_type_bits(cat):
+    # Bits of the precipitation types of category cat in the daily type masks
+    bits = 0
+    for precipitation_type in get_types(cat):
+        bits |= 1 << precipitation_types.index(precipitation_type)
+    return bits
+
+def type_mask_rows(types):
+    # First row of each day and bitmask (uint16) of the precipitation types of the day,
+    # types indexed by sorted timestamps (unknown types are ignored)
+    import numpy as np
+    from pandas import Categorical
+    codes = Categorical(np.asarray(types, dtype=object), categories=precipitation_types).codes.astype('int64')
+    bits = np.where(codes >= 0, np.left_shift(1, np.maximum(codes, 0)), 0).astype('uint16')
+    if len(bits) == 0:
+        return np.zeros(0, dtype='int64'), bits
+    days = types.index.values.astype('datetime64[D]')
+    first = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    return first, np.bitwise_or.reduceat(bits, first)
+
+def get_type_mask(types):
+    # Daily bitmask (uint16) of precipitation types, one bit per type in precipitation_types,
+    # membership of a category is then mask & get_type_bits(cat)
+    # Input
+    #   types           : series of precipitation types indexed by time, or a type mask
+    # Output
+    #   series indexed by the first time of each day (types itself if already a mask)
+    from pandas import Series
+    if types.dtype == 'uint16':
+        return types
+    if not types.index.is_monotonic_increasing:
+        types = types.sort_index(kind='stable')
+    first, mask = type_mask_rows(types)
+    return Series(mask, index=types.index[first], name=types.name)
+
+def get_type_mask_frame(df, idx):
+    # Archive of precipitation types with one row per day and the type mask as Value,
+    # so that the types are only compared once (see get_type_mask)
+    df = index_time(df, idx)
+    first, mask = type_mask_rows(df['Value'])
+    df = df.iloc[first].copy()
+    df['Value'] = mask
+    return df
+
+def set_index(df, idx):
+    # Index df by column idx, unless already indexed by idx
+    if df.index.name == idx and idx not in df.columns:
+        return df
+    return df.set_index(idx)
+
+def index_time(df, idx):
+    # Index df by column idx, sorted and without duplicated rows, 
+    # so that filter_time can use binary search
+    df = set_index(df, idx)
+    if df.index.has_duplicates:
+        # Keep rows with the same time but different values (e.g. precipitation types)
+        df = df.loc[~df.reset_index().duplicated().to_numpy()]
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind='stable')
+    return df
+
+def aggregate_days(df, col='Value'):
+    # Daily min, max, mean and count (not NaN) of column col of df indexed by sorted timestamps
+    # Output
+    #   DataFrame indexed by day (Date), only days with rows in df
+    import numpy as np
+    from pandas import DataFrame, DatetimeIndex
+    values = df[col].values.astype('float64')
+    days = df.index.values.astype('datetime64[D]')
+    if len(days) == 0:
+        return DataFrame({'min' : [], 'max' : [], 'mean' : [], 'count' : np.zeros(0, dtype='int64')},
+                         index=DatetimeIndex([], name='Date'))
+    first = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    missing = np.isnan(values)
+    count = np.add.reduceat(~missing, first)
+    total = np.add.reduceat(np.where(missing, 0, values), first)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count>0, total/count, np.nan)
+    return DataFrame({'min' : np.fmin.reduceat(values, first),
+                      'max' : np.fmax.reduceat(values, first),
+                      'mean' : mean,
+                      'count' : count.astype('int64')},
+                     index=DatetimeIndex(days[first].astype('datetime64[ns]'), name='Date'))
+
+def is_sorted_time(df):
+    # df indexed by sorted timestamps
+    from pandas import DatetimeIndex
+    return isinstance(df.index, DatetimeIndex) and df.index.is_monotonic_increasing
+
+# Resolution (numpy datetime unit) of partial ISO timestamp strings by length, 
+# e.g. '2012', '2012-04' or '2012-04-03'
+time_resolutions = {4 : 'Y', 7 : 'M', 10 : 'D', 13 : 'h', 16 : 'm', 19 : 's'}
+
+def time_bounds(ts):
+    # First and last time of a (partial) timestamp string, as pandas partial string indexing
+    from numpy import datetime64, timedelta64
+    unit = time_resolutions.get(len(ts))
+    if unit is None:
+        from pandas import Timestamp
+        start = Timestamp(ts).to_datetime64()
+        return start, start
+    start = datetime64(ts, unit)
+    return start.astype('datetime64[ns]'), (start+1).astype('datetime64[ns]') - timedelta64(1, 'ns')
+
+def slice_time(df, start, end=None):
+    # Rows of df (sorted by timestamp index) from start to end, as df.loc[start:end], 
+    # by binary search and without copying data
+    if end is None:
+        end = start
+    times = df.index.values
+    i1 = times.searchsorted(time_bounds(start)[0], side='left')
+    i2 = times.searchsorted(time_bounds(end)[1], side='right')
+    return df.iloc[i1:i2]
+
+def get_window(ts, time_period=None, direction=None):
+    # First and last time filter_time may use for ts, a timestamp or a range (start, end)
+    from pandas import DatetimeIndex, Timestamp
+    if isinstance(ts, (list, tuple, DatetimeIndex)) and len(ts) > 1:
+        times = [ts[0], ts[1]]
+        time_period = None
+    else:
+        times = [ts[0] if isinstance(ts, (list, tuple)) else ts]
+    bounds = []
+    for t in times:
+        if isinstance(t, str):
+            bounds += list(time_bounds(t))
+        else:
+            bounds.append(Timestamp(t).to_datetime64())
+    start, end = min(bounds), max(bounds)
+    if time_period is not None:
+        starts, ends = get_filters([start], time_period, direction)
+        start, end = min(start, starts[0]), max(end, ends[0])
+    return Timestamp(start), Timestamp(end)
+
 def filter_time(df, ts, time_period, idx, col, direction=None):
+    # Index once, df may also be indexed by idx already (see index_time)
+    df = set_index(df, idx)
+    # Binary search if indexed by sorted timestamps
+    sorted_time = is_sorted_time(df)
+    
     #Check if data is available the same day
     try:
         # Check format of timestamp
@@ -210,10 +484,18 @@ def filter_time(df, ts, time_period, idx, col, direction=None):
             
         # Use index to filter timestamp
         if len(ts)==1:
-            value = df.set_index(idx).loc[ts]
+            if sorted_time:
+                value = slice_time(df, ts[0])
+                if value.shape[0]==0:
+                    raise KeyError(ts[0])
+            else:
+                value = df.loc[ts]
         else:
             time_period = None
-            value = df.set_index(idx).loc[ts[0]:ts[1]]
+            if sorted_time:
+                value = slice_time(df, ts[0], ts[1])
+            else:
+                value = df.loc[ts[0]:ts[1]]
   
         is_available = value.size>0
     
@@ -228,11 +510,17 @@ def filter_time(df, ts, time_period, idx, col, direction=None):
                 qrstr = "`{0}` <= '{2}' and `{1}` >= '{2}'".format(idx1, idx2, ts[0])
             else:
                 qrstr = "`{0}` <= '{1}' and `{2}` >= '{3}'".format(idx1, ts[0], idx2, ts[1])
+        elif sorted_time:
+            # Index already searched
+            qrstr = None
         elif len(ts)==1:
-            qrstr = "{0} == '{1}'".format(idx, ts[0])
+            qrstr = "`{0}` == '{1}'".format(idx, ts[0])
         else:
             qrstr = "`{0}` >= '{1}' and `{0}` <= '{2}'".format(idx, ts[0], ts[1])
-        value = df.query(qrstr)
+        if qrstr is None:
+            value = df.iloc[:0]
+        else:
+            value = df.query(qrstr)
         
         is_available = value.size>0
         
@@ -245,10 +533,12 @@ def filter_time(df, ts, time_period, idx, col, direction=None):
     elif is_available:
         time_filter = get_filter(ts[0], time_period, direction=direction)
         
-        if len(time_filter)>=2:
-            df_filter = df.set_index(idx).loc[time_filter[0]:time_filter[-1]]
+        if sorted_time:
+            df_filter = slice_time(df, time_filter[0], time_filter[-1])
+        elif len(time_filter)>=2:
+            df_filter = df.loc[time_filter[0]:time_filter[-1]]
         else:
-            df_filter = df.set_index(idx).loc[time_filter[0]]
+            df_filter = df.loc[time_filter[0]]
         if col is not None:
             return df_filter[col]
         else:
@@ -258,6 +548,54 @@ def filter_time(df, ts, time_period, idx, col, direction=None):
         return value[col]
         
     
+def window_positions(times, ts, time_period, direction=None):
+    # Rows of the time windows of many timestamps in sorted times, by binary search
+    # Input
+    #   times           : sorted datetime64 array, e.g. index of df indexed by index_time
+    #   ts              : timestamps
+    # Output
+    #   i1, i2          : first and end position of each window (rows i1 to i2-1)
+    #   observed        : True if data is available at the timestamp, as checked by filter_time 
+    #                     (windows of other timestamps are not defined by their positions)
+    import numpy as np
+    from pandas import to_datetime
+    starts, ends = get_filters(to_datetime(list(ts)), time_period, direction)
+    i1 = times.searchsorted(starts, side='left')
+    i2 = times.searchsorted(ends, side='right')
+    
+    observed = np.zeros(len(ts), dtype=bool)
+    for k, t in enumerate(ts):
+        # Check if data is available the same day, as filter_time
+        if isinstance(t, (datetime.date, datetime.datetime)):
+            t = t.isoformat()
+        t1, t2 = time_bounds(t)
+        observed[k] = times.searchsorted(t1, side='left') < times.searchsorted(t2, side='right')
+    return i1, i2, observed
+
+def filter_times(df, ts, time_period, idx, col, direction=None):
+    # filter_time for many timestamps, all windows found by one binary search 
+    # if df is indexed by sorted timestamps (see index_time)
+    # Output
+    #   list of values, one per timestamp in ts
+    df = set_index(df, idx)
+    if not is_sorted_time(df) or len(ts)==0:
+        return [filter_time(df, t, time_period, idx, col, direction) for t in ts]
+    
+    values = df if col is None else df[col]
+    
+    # Time windows of all timestamps
+    i1, i2, observed = window_positions(df.index.values, ts, time_period, direction)
+    
+    output = []
+    for k, t in enumerate(ts):
+        if observed[k]:
+            output.append(values.iloc[i1[k]:i2[k]])
+        else:
+            if isinstance(t, (datetime.date, datetime.datetime)):
+                t = t.isoformat()
+            output.append(filter_time(df, t, time_period, idx, col, direction))
+    return output
+    
 def get_parameters():
     # See https://opendata.smhi.se/apidocs/metobs/parameter.html
     # Thanks also to https://github.com/LasseRegin/smhi-open-data
@@ -115,3 +115,27 @@ time_period = 'm'
 ts = '2012-01-03'
 indicator_value = climate.ZeroCrossingDays(station, ts, time_period)
 print('%s: ' % smhi.get_time_period(ts, time_period) + 'Zero crossing days = %d' % indicator_value)
+
+# Several indicators at once, each weather parameter is downloaded once
+# (output is a table with one row per station, time and indicator)
+df_indicators = climate.calc(['WarmDays', 'FrostDays', 'PR'], station, '2012-04-03')
+print(df_indicators)
+# All indicators
+df_indicators = climate.calc('all', station, '2012-04-03')
+
+# One value per time period for a date range (start, end), e.g. yearly warm days
+warm_days = climate.WarmDays(station, ('1990-01-01', '2020-12-31'), 'y')
+print(warm_days)
+# Seasonal zero crossing days (Dec-Feb, Mar-May, Jun-Aug, Sep-Nov)
+zero_crossing_days = climate.ZeroCrossingDays(station, ('2011-12-01', '2020-11-30'), 's')
+print(zero_crossing_days)
+
+# Indicators for a table of events, e.g. failures, each station is downloaded once
+events = pd.DataFrame({'asset' : ['A1', 'A2', 'A3'], 
+                       'station' : [station, station, station], 
+                       'ts' : ['2012-01-03', '2012-04-03', '2013-02-11']})
+df_events = climate.calc_events(events, ['FrostDays', 'PR'], windows=['s', 'y'])
+print(df_events)
+# Precipitation during the week before the event
+df_events = climate.calc_events(events, 'PR', windows='7days', direction='backward')
+print(df_events)
@@ -0,0 +1,75 @@
+import smhi
+import os
+import pickle
+import sqlite3
+import time
+
+# Persistent cache of indicator results (see climate.calc), a key-value table in a sqlite
+# file in smhi.CACHE_DIR. Each result is stored with the version of the data it was
+# calculated from, the least recently used results are evicted above MAX_RESULTS.
+MAX_RESULTS = 100000
+
+def get_results_path():
+    # File of result cache (None if cache is disabled)
+    if not smhi.CACHE_DIR:
+        return None
+    return os.path.join(smhi.CACHE_DIR, 'results.sqlite')
+
+def connect():
+    path = get_results_path()
+    if path is None:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path, timeout=30)
+    con.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT, value BLOB, accessed REAL)')
+    con.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+    return con
+
+def get_results(items):
+    # Cached results of items [(key, version), ...] calculated from the same data version
+    # Output
+    #   dict of values by key, only keys found with the same version
+    if len(items) == 0:
+        return {}
+    con = connect()
+    if con is None:
+        return {}
+    versions = dict(items)
+    found = {}
+    try:
+        with con:
+            keys = list(versions)
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = con.execute('SELECT key, version, value FROM results WHERE key IN (%s)' % ','.join('?'*len(chunk)), chunk)
+                for key, version, value in rows:
+                    if version == versions[key]:
+                        found[key] = pickle.loads(value)
+            con.executemany('UPDATE results SET accessed=? WHERE key=?', [(time.time(), key) for key in found])
+    finally:
+        con.close()
+    return found
+
+def put_results(items):
+    # Save results [(key, version, value), ...] and evict least recently used results
+    if len(items) == 0:
+        return
+    con = connect()
+    if con is None:
+        return
+    now = time.time()
+    try:
+        with con:
+            con.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                            [(key, version, pickle.dumps(value), now) for key, version, value in items])
+            excess = con.execute('SELECT COUNT(*) FROM results').fetchone()[0] - MAX_RESULTS
+            if excess > 0:
+                con.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)', (excess,))
+    finally:
+        con.close()
+
+def clear_results():
+    # Remove all cached results
+    path = get_results_path()
+    if path is not None and os.path.isfile(path):
+        os.remove(path)
@@ -0,0 +1,307 @@
+import numpy as np
+import pandas as pd
+
+# Codes of the SMHI quality flags (G: controlled, Y: suspect or aggregated, R: rejected)
+QUALITY_CODES = {'G' : 0, 'Y' : 1, 'R' : 2}
+UNKNOWN_QUALITY = 255
+# Decimals values are rounded to when computed from float32 (SMHI values have at most 2)
+VALUE_DECIMALS = 3
+
+class StationSeries:
+    # Daily values of a station as typed arrays, a compact alternative to pandas Series
+    # for the threshold and aggregate indicators (passed in data, see climate.py)
+    #   days            : int32 days since 1970-01-01, sorted and unique
+    #   values          : float32 values (bool for masks)
+    #   quality         : uint8 quality codes (QUALITY_CODES)
+    __slots__ = ('days', 'values', 'quality')
+
+    def __init__(self, days, values, quality=None):
+        self.days = days
+        self.values = values
+        if quality is None:
+            quality = np.full(len(days), UNKNOWN_QUALITY, dtype='uint8')
+        self.quality = quality
+
+    @classmethod
+    def from_series(cls, ser, quality=None):
+        # Series indexed by timestamps (one value per day), quality flags as series or array
+        days = ser.index.values.astype('datetime64[D]').astype('int32')
+        values = ser.values.astype('float32')
+        if quality is not None:
+            quality = pd.Series(np.asarray(quality)).map(QUALITY_CODES).fillna(UNKNOWN_QUALITY).values.astype('uint8')
+        if (np.diff(days) <= 0).any():
+            # sort and keep the first value of each day
+            order = np.argsort(days, kind='stable')
+            first = np.r_[True, np.diff(days[order]) > 0]
+            days, values = days[order][first], values[order][first]
+            quality = None if quality is None else quality[order][first]
+        return cls(days, values, quality)
+
+    @classmethod
+    def from_frame(cls, df, col='Value'):
+        # Data frame indexed by timestamps with value column and optional Quality column
+        return cls.from_series(df[col], df['Quality'] if 'Quality' in df.columns else None)
+
+    def to_series(self):
+        index = pd.DatetimeIndex(self.days.astype('datetime64[D]').astype('datetime64[ns]'), name='Date')
+        return pd.Series(self.floats(), index=index, name='Value')
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def size(self):
+        return len(self.days)
+
+    def __getitem__(self, key):
+        # Slice or boolean mask, slices are views of the arrays
+        return StationSeries(self.days[key], self.values[key], self.quality[key])
+
+    def slice_time(self, start, end=None):
+        # Days from start to end (date strings or timestamps) by binary search
+        start = np.datetime64(pd.Timestamp(start), 'D').astype('int32')
+        end = start if end is None else np.datetime64(pd.Timestamp(end), 'D').astype('int32')
+        return self[self.days.searchsorted(start, 'left'):self.days.searchsorted(end, 'right')]
+
+    def floats(self):
+        # Values as float64, without the float32 rounding errors
+        if self.values.dtype == 'float32':
+            return np.round(self.values.astype('float64'), VALUE_DECIMALS)
+        return self.values
+
+    def align(self, other):
+        # Values of self and other on the days of both
+        if not isinstance(other, StationSeries):
+            return self.days, self.floats(), other
+        if self.days is other.days or np.array_equal(self.days, other.days):
+            return self.days, self.floats(), other.floats()
+        days, i, j = np.intersect1d(self.days, other.days, assume_unique=True, return_indices=True)
+        return days, self.floats()[i], other.floats()[j]
+
+    def _apply(self, other, func):
+        days, a, b = self.align(other)
+        return StationSeries(days, func(a, b))
+
+    def __gt__(self, other): return self._apply(other, np.greater)
+    def __ge__(self, other): return self._apply(other, np.greater_equal)
+    def __lt__(self, other): return self._apply(other, np.less)
+    def __le__(self, other): return self._apply(other, np.less_equal)
+    def __and__(self, other): return self._apply(other, np.logical_and)
+    def __or__(self, other): return self._apply(other, np.logical_or)
+    def __add__(self, other): return self._apply(other, np.add)
+    def __sub__(self, other): return self._apply(other, np.subtract)
+
+    def __invert__(self):
+        return StationSeries(self.days, ~self.values, self.quality)
+
+    def sum(self):
+        return np.nansum(self.floats())
+
+    def max(self):
+        return np.nanmax(self.floats()) if self.has_values() else float('NaN')
+
+    def min(self):
+        return np.nanmin(self.floats()) if self.has_values() else float('NaN')
+
+    def mean(self):
+        return np.nanmean(self.floats()) if self.has_values() else float('NaN')
+
+    def has_values(self):
+        # Any value that is not NaN
+        return self.values.dtype == 'bool' or not np.isnan(self.values).all()
+
+    def period_keys(self, rule):
+        # Months since 1970 of the start of each value's time period
+        # (rule 'MS' month, 'QS-DEC' season or 'AS' year as in climate.period_rules)
+        months = self.days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+        if rule == 'MS':
+            return months, 1
+        if rule == 'QS-DEC':
+            return months - (months % 12 - 2) % 3, 3
+        if rule == 'AS':
+            return months - months % 12, 12
+        raise ValueError('Time period rule %s not supported' % rule)
+
+    def period_bounds(self, rule):
+        # Time periods of rule from the first to the last value, as pandas resample
+        # Output
+        #   starts          : months since 1970 of the start of each period
+        #   bounds          : rows bounds[i] to bounds[i+1]-1 are in period i
+        keys, step = self.period_keys(rule)
+        starts = np.arange(keys[0], keys[-1]+1, step) if self.size > 0 else np.zeros(0, dtype='int64')
+        bounds = np.searchsorted(keys, np.r_[starts, keys[-1]+step if self.size > 0 else 0])
+        return starts, bounds
+
+    def aggregate(self, func, rule=None):
+        # Aggregate values by function name ('sum','max','min','mean') or function of a
+        # StationSeries, of all values or of each time period of rule (as pandas resample)
+        if rule is None:
+            if self.size == 0:
+                return float('NaN')
+            return func(self) if callable(func) else getattr(self, func)()
+
+        starts, bounds = self.period_bounds(rule)
+        result = np.full(len(starts), np.nan)
+        filled = np.flatnonzero(np.diff(bounds) > 0)
+        if callable(func):
+            for i in filled:
+                result[i] = func(self[bounds[i]:bounds[i+1]])
+        elif len(filled) > 0:
+            # one reduction per time period with values
+            values = self.floats()
+            missing = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype='bool')
+            first = bounds[filled]
+            if func == 'max':
+                result[filled] = np.fmax.reduceat(values, first)
+            elif func == 'min':
+                result[filled] = np.fmin.reduceat(values, first)
+            elif func in ['sum', 'mean']:
+                total = np.add.reduceat(np.where(missing, 0, values), first)
+                if func == 'sum':
+                    result[filled] = total
+                else:
+                    with np.errstate(invalid='ignore'):
+                        result[filled] = total / np.add.reduceat(~missing, first)
+            else:
+                raise ValueError('Aggregation %s not supported' % func)
+        index = pd.DatetimeIndex(starts.astype('datetime64[M]').astype('datetime64[ns]'), name='Date')
+        return pd.Series(result, index=index)
+
+    def run_length(self, rule=None):
+        # Number of days in a row with value True, restarted each time period of rule
+        mask = self.values.astype('bool')
+        counts = np.cumsum(mask)
+        restart = ~mask
+        if rule is not None and self.size > 0:
+            keys, _ = self.period_keys(rule)
+            restart = restart | np.r_[True, np.diff(keys) != 0]
+        # last restart at or before each day
+        position = np.arange(self.size)
+        last = np.maximum.accumulate(np.where(restart, position, 0))
+        return StationSeries(self.days, counts - (counts[last] - mask[last]), self.quality)
+
+class WindowIndex:
+    # Cumulative sums, threshold counts and range extremes of the values of a station series,
+    # so that the sum, count, max or min of any window of rows (i1 to i2-1, see 
+    # helpers.window_positions) is found by two lookups instead of a scan of the window
+    #   sums            : sum of values[:i] (NaN as 0) for i = 0..n
+    #   counts          : number of values[:i] compared to a threshold, by (comparison, threshold)
+    #   extremes        : sparse tables by 'max' or 'min', level k is the extreme of the 
+    #                     2**k values from each row (built when first used)
+    __slots__ = ('values', 'sums', 'counts', 'extremes')
+    
+    comparisons = {'>' : np.greater, '>=' : np.greater_equal, '<' : np.less, '<=' : np.less_equal}
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype='float64')
+        self.sums = np.r_[0, np.cumsum(np.where(np.isnan(self.values), 0, self.values))]
+        self.counts = {}
+        self.extremes = {}
+
+    def add_threshold(self, comparison, threshold):
+        # Cumulative count of values compared to threshold (NaN never counted)
+        if (comparison, threshold) not in self.counts:
+            with np.errstate(invalid='ignore'):
+                mask = self.comparisons[comparison](self.values, threshold)
+            self.counts[(comparison, threshold)] = np.r_[0, np.cumsum(mask, dtype='int64')]
+
+    def sum(self, i1, i2):
+        # Sum of the values of each window, NaN for empty windows (as aggregate)
+        i1, i2 = np.asarray(i1), np.asarray(i2)
+        total = np.round(self.sums[i2] - self.sums[i1], VALUE_DECIMALS)
+        return np.where(i2 > i1, total, np.nan)
+
+    def count(self, comparison, threshold, i1, i2):
+        # Number of values of each window compared to threshold, NaN for empty windows
+        self.add_threshold(comparison, threshold)
+        i1, i2 = np.asarray(i1), np.asarray(i2)
+        counts = self.counts[(comparison, threshold)]
+        return np.where(i2 > i1, counts[i2] - counts[i1], np.nan)
+
+    def add_extremes(self, func):
+        # Sparse table of max or min (NaN ignored unless all values are NaN)
+        if func not in self.extremes:
+            reduce = {'max' : np.fmax, 'min' : np.fmin}[func]
+            levels = [self.values]
+            width = 1
+            while 2*width <= len(self.values):
+                previous = levels[-1]
+                levels.append(reduce(previous[:-width], previous[width:]))
+                width *= 2
+            self.extremes[func] = levels
+
+    def extreme(self, func, i1, i2):
+        # Max or min of the values of each window from two overlapping power of two ranges, 
+        # NaN for empty windows
+        self.add_extremes(func)
+        i1, i2 = np.asarray(i1), np.asarray(i2)
+        levels = self.extremes[func]
+        reduce = {'max' : np.fmax, 'min' : np.fmin}[func]
+        result = np.full(i1.shape, np.nan)
+        filled = np.flatnonzero(i2 > i1)
+        size = i2[filled] - i1[filled]
+        k = np.floor(np.log2(size)).astype('int64')
+        # log2 of large sizes may round up
+        k -= (1 << k) > size
+        for level in np.unique(k):
+            at = filled[k == level]
+            width = 1 << level
+            result[at] = reduce(levels[level][i1[at]], levels[level][i2[at]-width])
+        return result
+
+    def max(self, i1, i2):
+        return self.extreme('max', i1, i2)
+
+    def min(self, i1, i2):
+        return self.extreme('min', i1, i2)
+
+class RunIndex:
+    # Run-length encoding of a boolean series (e.g. values above a threshold), so that the 
+    # runs of True inside any window of rows (i1 to i2-1) are found by binary search, 
+    # for many windows at once. Runs are consecutive rows, as run_length.
+    #   starts, ends    : first and end row of each run (rows starts to ends-1)
+    #   lengths         : number of rows of each run
+    #   extremes        : WindowIndex of lengths for the longest run (built when first used)
+    __slots__ = ('starts', 'ends', 'lengths', 'extremes')
+
+    def __init__(self, mask):
+        edges = np.diff(np.r_[0, np.asarray(mask, dtype='int8'), 0])
+        self.starts = np.flatnonzero(edges == 1)
+        self.ends = np.flatnonzero(edges == -1)
+        self.lengths = self.ends - self.starts
+        self.extremes = None
+
+    def longest(self, i1, i2):
+        # Longest run of each window, runs cut by the window counted inside it,
+        # 0 if no True and NaN for empty windows (as the max of run_length)
+        i1, i2 = np.atleast_1d(i1), np.atleast_1d(i2)
+        # runs j1 to j2-1 overlap the window
+        j1 = self.ends.searchsorted(i1, 'right')
+        j2 = self.starts.searchsorted(i2, 'left')
+        result = np.where(i2 > i1, 0.0, np.nan)
+        at = np.flatnonzero((j2 > j1) & (i2 > i1))
+        if len(at) == 0:
+            return result
+        j1, j2, i1, i2 = j1[at], j2[at], i1[at], i2[at]
+        # first and last run cut by the window
+        first = np.minimum(self.ends[j1], i2) - np.maximum(self.starts[j1], i1)
+        last = np.minimum(self.ends[j2-1], i2) - np.maximum(self.starts[j2-1], i1)
+        if self.extremes is None:
+            self.extremes = WindowIndex(self.lengths)
+        inside = self.extremes.max(np.minimum(j1+1, j2-1), j2-1)
+        result[at] = np.fmax(np.maximum(first, last), inside)
+        return result
+
+    def first(self, i1, i2, days):
+        # Row where the first run of at least days rows inside each window reaches days rows,
+        # -1 if there is no such run
+        i1, i2 = np.atleast_1d(i1), np.atleast_1d(i2)
+        long = self.lengths >= days
+        starts, ends = self.starts[long], self.ends[long]
+        # first long run with days rows from i1
+        k = ends.searchsorted(i1 + days, 'left')
+        position = np.full(len(i1), -1)
+        found = np.flatnonzero(k < len(ends))
+        row = np.maximum(starts[k[found]], i1[found]) + days - 1
+        position[found] = np.where(row < i2[found], row, -1)
+        return position
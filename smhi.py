@@ -2,15 +2,59 @@
 
 import api_endpoints
 import helpers
-import requests
 import pandas as pd
 import json
 import logging
 import numbers
+import numpy as np
+from pandas.api.types import union_categoricals
 import csv
+import io
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+# -- cache
+# Folder for parsed corrected archives (set to None to disable the disk cache)
+CACHE_DIR = os.environ.get('SMHI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'smhi'))
+# Folder of memory-mapped station x hour cubes of hourly parameters, used by get_values 
+# for stations in a cube (None disables, see cube.py)
+CUBE_DIR = os.environ.get('SMHI_CUBE_DIR')
+# Folder of columnar store partitioned by year, used by get_values (None disables, see store.py)
+STORE_DIR = os.environ.get('SMHI_STORE_DIR')
+# Seconds a downloaded station list is reused to check if an archive is updated
+STATION_LIST_TTL = 3600
+# Seconds a station list in the station availability index is reused (see get_station_index)
+STATION_INDEX_TTL = 24*3600
+# Max bytes of parsed data frames kept in memory (0 disables the memory cache)
+MEMORY_CACHE_BYTES = 512*1024**2
+# Seconds latest months data is kept in memory
+LATEST_MONTHS_TTL = 600
+# Parser for csv archives ('c' for pandas C engine, 'pyarrow' or 'csv' for csv.DictReader)
+CSV_ENGINE = 'c'
+# Number of concurrent downloads in get_many
+MAX_WORKERS = 4
 
-def list_stations(param, ts=None):
+# Formats of date and time columns in the csv archives
+DATE_FORMATS = {
+    'Datum' : '%Y-%m-%d',
+    'Representativt dygn' : '%Y-%m-%d',
+    'Från Datum Tid (UTC)' : '%Y-%m-%d %H:%M:%S',
+    'Till Datum Tid (UTC)' : '%Y-%m-%d %H:%M:%S',
+    'Tid (UTC)' : '%H:%M:%S',
+    }
+TIME_FORMAT = '%H:%M:%S'
+
+_station_lists = {}
+_station_index = {}
+_memory_cache = OrderedDict()
+_memory_cache_bytes = 0
+_memory_cache_lock = threading.RLock()
+
+
+def download_stations(param):
     # validate parameter input
     param = get_param_value(param)
     
@@ -28,14 +72,68 @@ def list_stations(param, ts=None):
     # fix the date and time variables into something readable
     for col in ['from', 'to', 'updated']:
         df[col] = pd.to_datetime(df[col], unit="ms")
+    
+    return df
 
+def available(df, ts=None):
+    # Mask of stations in station list df available at ts, or during all of a date range (start, end)
     if ts is None:
-        return(df)
+        return np.ones(df.shape[0], dtype=bool)
+    if isinstance(ts, (list, tuple)):
+        start, end = pd.to_datetime(ts[0]), pd.to_datetime(ts[1])
     else:
-        # filter based on timestamp
-        qrstr = "`from` <= '{0}' and `to` >= '{0}'".format(pd.to_datetime(ts).isoformat())
-        return df.query(qrstr)
+        start = end = pd.to_datetime(ts)
+    return ((df['from'] <= start) & (df['to'] >= end)).values
+
+def get_station_entry(param, use_cache=True):
+    # Station list of parameter in the station index, with the (from, to) of each station,
+    # kept in memory and in CACHE_DIR and downloaded again after STATION_INDEX_TTL seconds.
+    # Only downloaded lists are saved, a failed download raises and is tried again next call.
+    param = get_param_value(param)
+    entry = _station_index.get(param)
+    if use_cache and entry is not None and time.time()-entry['built'] <= STATION_INDEX_TTL:
+        return entry
+    
+    path = os.path.join(CACHE_DIR, 'stations', '%s.pkl' % param) if CACHE_DIR else None
+    entry = None
+    if use_cache and path is not None and os.path.isfile(path):
+        try:
+            entry = pd.read_pickle(path)
+        except Exception as e:
+            logging.warning('Could not read cache file %s: %s' % (path, e))
+        if entry is not None and time.time()-entry['built'] > STATION_INDEX_TTL:
+            entry = None
+    if entry is None:
+        entry = {'built' : time.time(), 'data' : download_stations(param)}
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+            pd.to_pickle(entry, tmp_path)
+            os.replace(tmp_path, path)
+    
+    df = entry['data']
+    entry['intervals'] = dict(zip(df['id'], zip(df['from'], df['to'])))
+    _station_index[param] = entry
+    return entry
 
+def get_station_index(params=None):
+    # Station availability index of parameters (default all) in one table, station lists not
+    # in the index are downloaded concurrently (see get_station_entry)
+    # Output
+    #   DataFrame with columns param, id, name, latitude, longitude, active, from, to, updated
+    if params is None:
+        params = list_parameters()['key'].tolist()
+    params = list(dict.fromkeys(get_param_value(param) for param in params))
+    entries = get_many([(param,) for param in params], func=get_station_entry)
+    df = pd.concat([entries[(param,)]['data'].assign(param=param) for param in params], ignore_index=True)
+    cols = ['param'] + [col for col in df.columns if col != 'param']
+    return df[cols]
+
+def list_stations(param, ts=None):
+    # Stations of parameter (available at ts or during date range (start, end)), 
+    # from the station index
+    df = get_station_entry(param)['data']
+    return df.loc[available(df, ts)].copy()
 
 def list_parameters():
     df_parameters = pd.DataFrame(helpers.get_parameters())
@@ -45,10 +143,15 @@ def list_indicators():
     df_indicators = pd.DataFrame(helpers.get_indicators())
     return df_indicators
 
+# Validated parameter ids by input string
+_param_values = {}
+
 def get_param_value(parameter):
     # check if parameter isnumeric
     if isinstance(parameter,numbers.Number):
         parameter_id = parameter
+    elif parameter in _param_values:
+        parameter_id = _param_values[parameter]
     else:
         # Load parameters
         df_parameters = pd.DataFrame(helpers.get_parameters())
@@ -56,42 +159,178 @@ def get_param_value(parameter):
         valid_param = helpers.validatestring(parameter, df_parameters['label'].to_list())
         # Get id
         parameter_id = df_parameters.set_index('label').loc[valid_param, 'key']
+        _param_values[parameter] = parameter_id
     
     return parameter_id        
 
 def isin_station(parameter, station, ts=None):
-    # Validate paramter input
-    parameter_id = get_param_value(parameter)
-    
-    # check if parameter is available on station
-    df_stations = list_stations(parameter_id, ts=ts)
-    valid_stations = df_stations['id'].to_list()
-    return station in valid_stations
+    # Parameter is available at station (at ts or during date range (start, end)), 
+    # from the station index
+    interval = get_station_entry(parameter)['intervals'].get(station)
+    if interval is None:
+        return False
+    if ts is None:
+        return True
+    if isinstance(ts, (list, tuple)):
+        start, end = pd.to_datetime(ts[0]), pd.to_datetime(ts[1])
+    else:
+        start = end = pd.to_datetime(ts)
+    return interval[0] <= start and interval[1] >= end
+
+def isin_stations(parameters, stations, ts=None):
+    # isin_station for many parameters and stations at once
+    # Output
+    #   DataFrame of bool indexed by station with one column per parameter
+    parameter_ids = [get_param_value(parameter) for parameter in parameters]
+    df = get_station_index(parameter_ids)
+    df = df.loc[df['id'].isin(stations)]
+    df = df.loc[available(df, ts)]
+    isin = pd.crosstab(df['id'], df['param']).reindex(index=list(stations), columns=parameter_ids, fill_value=0) > 0
+    isin.columns = list(parameters)
+    isin.index.name = 'station'
+    return isin
 
 def get_time_period(ts, time_period):
     if isinstance(time_period, str):
         ts = pd.to_datetime(ts)
     return tuple(helpers.get_filter(ts, time_period))
 
-def read_csv(adr_full, delimiter=';', usecols=None, parse_dates=None, keep_date_col=True, dtype=None):    
-    response = requests.get(adr_full).text
-    lines = response.splitlines()
-    header_row = 8
-    for k, line in enumerate(lines):
-        if k>=header_row and 'Datum' in line:
-            header_row = k
-            break
+def read_csv(adr_full, delimiter=';', usecols=None, parse_dates=None, keep_date_col=True, dtype=None, engine=None):    
+    response = helpers.http_get(adr_full)
+    return parse_csv(response.content, delimiter=delimiter, usecols=usecols, parse_dates=parse_dates, 
+                     keep_date_col=keep_date_col, dtype=dtype, encoding=response.encoding or 'utf-8', engine=engine)
+
+def find_header(content, header_row=8, key=b'Datum'):
+    # Byte offsets (start, end) of the header line, i.e. first line 
+    # from row header_row that contains key
+    start = 0
+    k = 0
+    fallback = None
+    while start < len(content):
+        end = content.find(b'\n', start)
+        if end < 0:
+            end = len(content)
+        if k == header_row:
+            fallback = (start, end)
+        if k >= header_row and key in content[start:end]:
+            return start, end
+        start = end+1
+        k += 1
+    return fallback if fallback is not None else (start, start)
+
+def parse_csv(content, delimiter=';', usecols=None, parse_dates=None, keep_date_col=True, dtype=None, encoding='utf-8', engine=None):
+    # Parse SMHI csv data (bytes)
+    # Input
+    #   engine          : 'c' (pandas), 'pyarrow' or 'csv' (csv.DictReader), default CSV_ENGINE
+    if engine is None:
+        engine = CSV_ENGINE
     
-    skip_rows = header_row+1
+    header_start, header_end = find_header(content)
     
-    cols = lines[header_row].split(delimiter)
+    cols = content[header_start:header_end].decode(encoding).rstrip('\r').split(delimiter)
     # print(cols)
     
     if usecols is not None:
-        cols=[col for k,col in enumerate(cols) if k in usecols or col in usecols]
-    d = csv.DictReader(lines[skip_rows:], delimiter=delimiter, fieldnames=cols)
-    df = pd.DataFrame(data=list(d), columns=cols)
+        positions = [k for k,col in enumerate(cols) if k in usecols or col in usecols]
+    else:
+        positions = list(range(len(cols)))
+    names = [cols[k] for k in positions]
+    data = content[header_end+1:]
+    
+    if engine == 'csv':
+        dtypes = {}
+        lines = data.decode(encoding).splitlines()
+        d = csv.DictReader(lines, delimiter=delimiter, fieldnames=names)
+        df = pd.DataFrame(data=list(d), columns=names)
+    else:
+        # columns converted to numbers are read as float directly, 
+        # dtype refers to the columns after the dates are parsed
+        parsed = parse_date_columns(pd.DataFrame(columns=names, dtype=object), parse_dates, keep_date_col)
+        numeric = [col for col in get_dtype_columns(parsed, dtype) if col in names]
+        # separate date and time columns repeat (e.g. 24 rows per date in hourly 
+        # data), read as categories so each unique string is parsed once
+        dates = [col for col in get_date_columns(names, parse_dates, combined=True) if col not in numeric]
+        dtypes = dict({col : 'float64' for col in numeric}, **{col : 'category' for col in dates})
+        try:
+            df = read_table(data, len(cols), positions, names, dtypes, delimiter, encoding, engine)
+        except ValueError:
+            # non-numeric values, read as text and convert with pd.to_numeric below
+            dtypes = {col : 'category' for col in dates}
+            df = read_table(data, len(cols), positions, names, dtypes, delimiter, encoding, engine)
+    
+    df = parse_date_columns(df, parse_dates, keep_date_col)
+    # date columns that are kept as text
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    df = convert_dtypes(df, dtype, skip=[col for col, ty in dtypes.items() if ty == 'float64'])
+    return df
+
+def read_table(data, ncols, positions, names, dtypes={}, delimiter=';', encoding='utf-8', engine='c'):
+    # Read csv data (bytes without header) with the pandas C engine or pyarrow, 
+    # columns with dtypes 'float64' or 'category' and the rest as text
+    if engine == 'pyarrow':
+        df = read_table_pyarrow(data, positions, names, dtypes, delimiter, encoding)
+        if df is not None:
+            return df
+    
+    # All columns are named since rows may have fewer fields than the header 
+    # (usecols would fail on that), unused columns are dropped after reading
+    dtype = {k : str for k in range(ncols)}
+    dtype.update({k : dtypes[col] for k,col in zip(positions, names) if col in dtypes})
+    df = pd.read_csv(io.BytesIO(data), sep=delimiter, header=None, names=list(range(ncols)), 
+                     dtype=dtype, encoding=encoding, engine='c')
+    df = df[positions]
+    df.columns = names
+    return df
+
+def read_table_pyarrow(data, positions, names, dtypes={}, delimiter=';', encoding='utf-8'):
+    # Read csv data with pyarrow, returns None if the rows are too irregular 
+    # or there are no rows (pyarrow fails on empty data, pandas reads an empty frame)
+    if len(data.strip()) == 0:
+        return None
+    import pyarrow
+    from pyarrow import csv as pa_csv
+    
+    # Width of rows from last line, SMHI archives have extra fields 
+    # (Tidsutsnitt) on the first rows only, these are parsed with pandas
+    lines = data.rstrip().rsplit(b'\n', 1)
+    width = lines[-1].count(delimiter.encode(encoding))+1
+    column_names = [str(k) for k in range(width)]
+    include_columns = [str(k) for k in positions]
+    types = {'float64' : pyarrow.float64(), 'category' : pyarrow.dictionary(pyarrow.int32(), pyarrow.string())}
+    
+    skipped = []
+    def skip_row(row):
+        skipped.append(row.text)
+        return 'skip'
+    
+    table = pa_csv.read_csv(
+        io.BytesIO(data), 
+        read_options=pa_csv.ReadOptions(column_names=column_names, encoding=encoding),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter, invalid_row_handler=skip_row),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=include_columns, 
+            include_missing_columns=True,
+            column_types={k : types.get(dtypes.get(col), pyarrow.string()) for k,col in zip(include_columns, names)},
+            strings_can_be_null=True))
+    df = table.to_pandas()
+    df.columns = names
     
+    if len(skipped)>0:
+        head = data.split(b'\n', len(skipped))
+        if [line.rstrip(b'\r').decode(encoding) for line in head[:-1]] != skipped:
+            return None
+        df_head = read_table(b'\n'.join(head[:-1]), len(skipped[0].split(delimiter)), positions, names, dtypes, delimiter, encoding, engine='c')
+        parts = [df_head, df]
+        df = pd.concat(parts, ignore_index=True)
+        # keep categories (pd.concat returns text for different categories)
+        for col, ty in dtypes.items():
+            if ty == 'category':
+                df[col] = union_categoricals([part[col] for part in parts])
+    return df
+
+def parse_date_columns(df, parse_dates=None, keep_date_col=True):
     if parse_dates is not None:
         # [['Datum', 'Tid (UTC)']]
         if isinstance(parse_dates, dict):            
@@ -111,10 +350,14 @@ def read_csv(adr_full, delimiter=';', usecols=None, parse_dates=None, keep_date_
                 result = parse_date
                 
             if isinstance(parse_date, list):
-                # s = pd.to_datetime(df[parse_date].astype(str).agg(' '.join, axis=1))
-                s = pd.to_datetime(df[parse_date[0]].str.cat(df[parse_date[1]], sep=' '))
+                if DATE_FORMATS.get(parse_date[1]) == TIME_FORMAT:
+                    # date column plus time column, no string concatenation
+                    s = to_datetime(df[parse_date[0]], DATE_FORMATS.get(parse_date[0])) + to_timedelta(df[parse_date[1]])
+                else:
+                    # s = pd.to_datetime(df[parse_date].astype(str).agg(' '.join, axis=1))
+                    s = pd.to_datetime(df[parse_date[0]].astype(str).str.cat(df[parse_date[1]].astype(str), sep=' '))
             else:
-                s = pd.to_datetime(df[parse_date])
+                s = to_datetime(df[parse_date], DATE_FORMATS.get(parse_date))
             
             if result==parse_date:
                 df[result] = s                
@@ -133,93 +376,271 @@ def read_csv(adr_full, delimiter=';', usecols=None, parse_dates=None, keep_date_
                     elif isinstance(keep_date_col, list):
                         if not col in keep_date_col:
                             df.drop(labels=col, axis=1, inplace=True)
-                      
+    return df
+
+def get_date_columns(names, parse_dates=None, combined=False):
+    # Names of the columns in parse_dates (only columns combined 
+    # into one date, e.g. ['Datum', 'Tid (UTC)'], if combined)
+    if parse_dates is None:
+        return []
+    if isinstance(parse_dates, dict):
+        parse_dates = parse_dates.values()
+    date_columns = []
+    for parse_date in parse_dates:
+        if not isinstance(parse_date, list):
+            if combined:
+                continue
+            parse_date = [parse_date]
+        for col in parse_date:
+            date_columns.append(col if isinstance(col, str) else names[col])
+    return date_columns
+
+def factorize(values):
+    # Codes and unique values, categories are used as is
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return np.asarray(values.cat.codes), values.cat.categories
+    return pd.factorize(values)
+
+def to_datetime(values, format=None):
+    # Parse dates (datetime64[ns]) with explicit format, each unique value is 
+    # parsed once and mapped back to all rows
+    codes, uniques = factorize(values)
+    try:
+        parsed = pd.to_datetime(uniques, format=format)
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime(uniques)
+    # missing values have code -1, i.e. the NaT appended last
+    parsed = np.append(np.asarray(parsed, dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return parsed[codes]
+
+def to_timedelta(values):
+    # Parse times of day ('%H:%M:%S') as timedelta64[ns]
+    codes, uniques = factorize(values)
+    parsed = np.append(np.asarray(pd.to_timedelta(uniques), dtype='timedelta64[ns]'), np.timedelta64('NaT', 'ns'))
+    return parsed[codes]
+
+def get_dtype_columns(df, dtype=None):
+    # Column names of dtype (dict or list) 
+    if dtype is None:
+        return []
+    if isinstance(dtype, dict):
+        return [key if isinstance(key, str) else df.columns[key] for key in dtype]
+    return [df.columns[k] for k in range(len(dtype))]
+
+def convert_dtypes(df, dtype=None, skip=[]):
+    # Convert columns to numeric, columns in skip are already float
     if dtype is not None:
-        if isinstance(dtype, dict):
-            for key, ty in dtype.items():
-                if not isinstance(key, str):
-                    key = df.columns[key]
-                if ty == 'numeric':
-                    df[key] = pd.to_numeric(df[key], errors='coerce')
-                else:
-                    df[key] = pd.to_numeric(df[key], downcast=ty, errors='coerce')
-                    # df[key] = df[key].astype(ty)
-        else:
-            for k, ty in enumerate(dtype):
-                key = df.columns[k]
-                if ty == 'numeric':
+        if not isinstance(dtype, dict):
+            dtype = dict(enumerate(dtype))
+        for key, ty in dtype.items():
+            if not isinstance(key, str):
+                key = df.columns[key]
+            if ty == 'numeric':
+                if key not in skip:
                     df[key] = pd.to_numeric(df[key], errors='coerce')
-                else:
-                    df[key] = pd.to_numeric(df[key], downcast=ty, errors='coerce')
-                    # df[key] = df[key].astype(ty)  
+            else:
+                df[key] = pd.to_numeric(df[key], downcast=ty, errors='coerce')
+                # df[key] = df[key].astype(ty)
     return df
 
-def get_corrected(param, station, translate=True, json=False):
-    # validate input weather parameter (param)
-    param = get_param_value(param)
-    
-    # create the API adress
-    adr = api_endpoints.ADR_CORRECTED
-    adr_full = adr.format(parameter = param, station = station)  
-    print(adr_full)
+def get_read_options(param):
+    # csv read options for the corrected archive of a weather parameter
+    # Output
+    #   k_value         : column index of the parameter value
+    #   options         : keyword arguments to read_csv
+    hourly = dict(usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'])
+    daily = dict(usecols=[0,1,2,3,4], parse_dates=[0,1,2])
     
-    # download the csv data
     if param in [1, 26, 27, 39]: #[TemperaturePast1h]        
         k_value = 2        
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})      
+        options = dict(hourly, dtype={k_value:'numeric'})
     elif param in [2, 19, 20]: #[TemperaturePast24h, TemperatureMinPast24h, TemperatureMaxPast24h]        
         k_value = 3
-        df = read_csv(adr_full, usecols=[0,1,2,3,4], parse_dates=[0,1,2], dtype={k_value:'numeric'})  
-        
+        options = dict(daily, dtype={k_value:'numeric'})
     elif param in [3,4,21]: #[Windspeed, WindDirection, WindGust]
         k_value = 2
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})
-        
-    
+        options = dict(hourly, dtype={k_value:'numeric'})
     elif param in [5, 23]: #[PrecipPast24hAt06, PrecipPastMonth]        
         k_value = 3
-        df = read_csv(adr_full, usecols=[0,1,2,3,4], parse_dates=[0,1,2], dtype={k_value:'numeric'})  
-        
+        options = dict(daily, dtype={k_value:'numeric'})
     elif param in [6]: #[Humidity]
         k_value = 2    
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})
-        
-
+        options = dict(hourly, dtype={k_value:'numeric'})
     elif param in [7]: #[PrecioPast1h]
         k_value = 2
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})
-        
-        
+        options = dict(hourly, dtype={k_value:'numeric'})
     elif param in [8]: #[SnowDepthPast24h]
         k_value = 2
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})
-        
-    
+        options = dict(hourly, dtype={k_value:'numeric'})
     elif param in [9, 12, 13]: #[Pressure, Visibility, CurrentWeather]
         k_value = 2
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})
-    
+        options = dict(hourly, dtype={k_value:'numeric'})
     elif param in [16, 28, 29, 30, 31, 32, 33, 36]: #[ CloudCover]
         k_value = 2
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})
-        
+        options = dict(hourly, dtype={k_value:'numeric'})
     elif param in [18]: #[PrecipTypePast24h] 
         k_value = 3        
-        df = read_csv(adr_full, usecols=[0,1,2,3,4], parse_dates=[0,1,2])
-    
-        
+        options = dict(daily)
     elif param in [17]: #[PrecipPast12h] 
         k_value = 2
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'])
-        
+        options = dict(hourly)
     elif param in [40]: #[GroundCondition]
         k_value = 2
-        df = read_csv(adr_full, usecols=[0,1,2,3], parse_dates={'Datum (UTC)': ['Datum', 'Tid (UTC)']}, keep_date_col=['Datum'], dtype={k_value:'numeric'})
-    
+        options = dict(hourly, dtype={k_value:'numeric'})
     else:
         k_value = 3
-        df = read_csv(adr_full, usecols=[0,1,2,3,4], parse_dates=[0,1,2], dtype={k_value:'numeric'})
+        options = dict(daily, dtype={k_value:'numeric'})
+    
+    return k_value, options
+
+def get_updated(param, station):
+    # Timestamp when station data for parameter was last updated 
+    # (None if station is not listed for parameter)
+    param = get_param_value(param)
+    
+    # Reuse station list if downloaded within STATION_LIST_TTL seconds
+    listed = _station_lists.get(param)
+    if listed is None or time.time()-listed[0] > STATION_LIST_TTL:
+        listed = (time.time(), download_stations(param))
+        _station_lists[param] = listed
+    
+    df_stations = listed[1]
+    updated = df_stations.loc[df_stations['id']==station, 'updated']
+    if updated.size==0:
+        return None
+    return updated.iloc[0]
+
+def get_cache_path(param, station, kind='corrected'):
+    # File of cached corrected archive, or of other kind of data derived from it 
+    # (e.g. 'daily', see get_daily), None if cache is disabled
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, kind, '%s_%s.pkl' % (param, station))
+
+def read_cache_entry(param, station, kind='corrected'):
+    # Read cached data and its update timestamp, returns None if missing
+    path = get_cache_path(param, station, kind)
+    if path is None or not os.path.isfile(path):
+        return None
+    try:
+        return pd.read_pickle(path)
+    except Exception as e:
+        logging.warning('Could not read cache file %s: %s' % (path, e))
+        return None
+
+def read_cache(param, station, updated=None, kind='corrected'):
+    # Read cached corrected archive, returns None if missing or outdated
+    cached = read_cache_entry(param, station, kind)
+    if cached is None or cached['updated'] != updated:
+        return None
+    return cached['data']
+
+def write_cache(param, station, df, updated=None, kind='corrected'):
+    # Save parsed corrected archive together with its update timestamp
+    path = get_cache_path(param, station, kind)
+    if path is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to temporary file first so an interrupted write never leaves a broken cache
+    tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+    pd.to_pickle({'updated' : updated, 'data' : df}, tmp_path)
+    os.replace(tmp_path, path)
+
+def clear_cache(param=None, station=None):
+    # Remove cached corrected archives and derived data, all or for given parameter and/or station
+    if not CACHE_DIR:
+        return
+    if param is not None:
+        param = get_param_value(param)
+    for kind in ['corrected', 'daily']:
+        folder = os.path.join(CACHE_DIR, kind)
+        if not os.path.isdir(folder):
+            continue
+        for file in os.listdir(folder):
+            key = file.split('.')[0].split('_')
+            if param is not None and key[0] != str(param):
+                continue
+            if station is not None and key[-1] != str(station):
+                continue
+            os.remove(os.path.join(folder, file))
+
+def memory_get(key, updated=None, max_age=None):
+    # Get data frame from the in-memory cache (None if missing or outdated)
+    with _memory_cache_lock:
+        entry = _memory_cache.get(key)
+        if entry is None:
+            return None
+        df, entry_updated, _, created = entry
+        if entry_updated != updated or (max_age is not None and time.time()-created > max_age):
+            memory_remove(key)
+            return None
+        # mark as recently used
+        _memory_cache.move_to_end(key)
+    # shallow copy so callers can add or rename columns without changing the cache
+    return df.copy(deep=False)
+
+def memory_put(key, df, updated=None):
+    # Add data frame to the in-memory cache and evict least recently used 
+    # entries until the total size is within MEMORY_CACHE_BYTES
+    global _memory_cache_bytes
+    nbytes = int(df.memory_usage(deep=True).sum())
+    with _memory_cache_lock:
+        memory_remove(key)
+        if nbytes > MEMORY_CACHE_BYTES:
+            return
+        _memory_cache[key] = (df, updated, nbytes, time.time())
+        _memory_cache_bytes += nbytes
+        while _memory_cache_bytes > MEMORY_CACHE_BYTES:
+            _, entry = _memory_cache.popitem(last=False)
+            _memory_cache_bytes -= entry[2]
 
+def memory_remove(key):
+    global _memory_cache_bytes
+    with _memory_cache_lock:
+        entry = _memory_cache.pop(key, None)
+        if entry is not None:
+            _memory_cache_bytes -= entry[2]
+
+def clear_memory_cache():
+    global _memory_cache_bytes
+    with _memory_cache_lock:
+        _memory_cache.clear()
+        _memory_cache_bytes = 0
+
+def get_corrected(param, station, translate=True, json=False, use_cache=True):
+    # validate input weather parameter (param)
+    param = get_param_value(param)
+    
+    # csv options for parameter
+    k_value, options = get_read_options(param)
+    
+    # use parsed archive from memory or disk if not updated since it was saved
+    df = None
+    updated = None
+    if use_cache:
+        if CACHE_DIR:
+            updated = get_updated(param, station)
+        df = memory_get(('corrected', param, station), updated)
+        if df is None and CACHE_DIR:
+            df = read_cache(param, station, updated)
+            if df is not None:
+                memory_put(('corrected', param, station), df, updated)
+                df = df.copy(deep=False)
+    
+    if df is None:
+        # create the API adress
+        adr = api_endpoints.ADR_CORRECTED
+        adr_full = adr.format(parameter = param, station = station)  
+        print(adr_full)
+        
+        # download the csv data
+        df = read_csv(adr_full, **options)
+        
+        if use_cache:
+            if CACHE_DIR:
+                write_cache(param, station, df, updated)
+            memory_put(('corrected', param, station), df, updated)
+            df = df.copy(deep=False)
   
     # Rename columns to english
     if df.shape[0]>0 and translate:
@@ -240,39 +661,102 @@ def get_corrected(param, station, translate=True, json=False):
         #     columns[df.columns[1]] = 'Date' 
         columns[df.columns[k_value]] = 'Value'
         # columns[df.columns[k_value+1]] = 'Quality'
-        df.rename(columns = columns, inplace=True)
+        df = df.rename(columns = columns)
         
     return df
 
 
-def get_latest_months(param, station):
+def get_indexed(param, station, idx='Date', use_cache=True):
+    # Corrected archive indexed by idx, sorted and without duplicated rows,
+    # kept in memory so that time filtering is a binary search (see helpers.filter_time)
+    param = get_param_value(param)
+    
+    updated = None
+    if use_cache:
+        if CACHE_DIR:
+            updated = get_updated(param, station)
+        df = memory_get(('indexed', param, station, idx), updated)
+        if df is not None:
+            return df
+    
+    df = helpers.index_time(get_corrected(param, station, use_cache=use_cache), idx)
+    if use_cache:
+        memory_put(('indexed', param, station, idx), df, updated)
+        df = df.copy(deep=False)
+    
+    return df
+
+
+def get_daily(param, station, use_cache=True):
+    # Daily min, max, mean and count of an hourly parameter (days of Date (UTC)), indexed by Date.
+    # Cached next to the corrected archive, when the archive is updated only the days 
+    # from the last cached day are aggregated again
+    param = get_param_value(param)
+    
+    updated = None
+    daily = None
+    previous = None
+    if use_cache:
+        if CACHE_DIR:
+            updated = get_updated(param, station)
+        daily = memory_get(('daily', param, station), updated)
+        if daily is not None:
+            return daily
+        cached = read_cache_entry(param, station, 'daily')
+        if cached is not None:
+            if cached['updated'] == updated:
+                daily = cached['data']
+            else:
+                previous = cached['data']
+    
+    if daily is None:
+        hourly = get_indexed(param, station, 'Date (UTC)', use_cache=use_cache)
+        if previous is not None and previous.shape[0]>0:
+            # last cached day may have been incomplete
+            first = hourly.index.values.searchsorted(previous.index.values[-1])
+            daily = pd.concat([previous.iloc[:-1], helpers.aggregate_days(hourly.iloc[first:])])
+        else:
+            daily = helpers.aggregate_days(hourly)
+        if use_cache:
+            write_cache(param, station, daily, updated, 'daily')
+    
+    if use_cache:
+        memory_put(('daily', param, station), daily, updated)
+        daily = daily.copy(deep=False)
+    return daily
+
+def get_latest_months(param, station, use_cache=True):
     # validate input weather parameter (param)
     param = get_param_value(param)    
+    
+    # reuse recently downloaded data
+    if use_cache:
+        df = memory_get(('latest', param, station), max_age=LATEST_MONTHS_TTL)
+        if df is not None:
+            return df
+    
     # create the API adress
     adr = api_endpoints.ADR_LATEST_MONTHS
     adr_full = adr.format(parameter = param, station = station)    
     # print(adr_full)
     
     # initiate the call
-    response = requests.get(adr_full)    
+    response = helpers.http_get(adr_full)    
     # try to get the json data (exceptions will be catched later)    
     df = pd.DataFrame(response.json()['value'])
     
     df.rename(columns = {'Value':'value'}, inplace=True)
     
-    if param in [5]: #PrecipPast24hAt06
-        date_cols = ['from', 'to', 'ref']
-        df['value'] = pd.to_numeric(df['value'])
-    elif param in [17]: #PrecipPast12h
-        date_cols = ['date']
-    else:
-        date_cols = ['date']
+    # Daily values (e.g. PrecipPast24hAt06) have from, to and ref, other values date
+    date_cols = [col for col in ['date', 'from', 'to', 'ref'] if col in df.columns]
+    if param not in [17, 18]: #PrecipPast12h, PrecipTypePast24h
         df['value'] = pd.to_numeric(df['value'])
     for col in date_cols:
         if col=='ref':
-            df[col] = pd.to_datetime(df[col]).dt.date
+            df[col] = pd.Series(to_datetime(df[col], DATE_FORMATS['Datum']), index=df.index).dt.date
         else:
-            df[col] = pd.to_datetime(df[col]*1e6)
+            # epoch milliseconds
+            df[col] = pd.to_datetime(df[col].astype('int64'), unit='ms')
     
     
     columns = {
@@ -286,10 +770,105 @@ def get_latest_months(param, station):
     # columns[df.columns[k_value]] = 'Value'    
     df.rename(columns = columns, inplace=True)
     
+    if use_cache:
+        memory_put(('latest', param, station), df)
+        df = df.copy(deep=False)
+    
     return df
 
 
-def get_values(param, station, ts=None, time_period=None, idx='Date', col='Value', check_station=False, direction=None):
+def merge_latest(df, latest):
+    # Append the latest months to the corrected archive df, rows of the latest months 
+    # at times already in df are dropped (corrected values are kept)
+    if latest.shape[0]==0:
+        return df
+    latest = latest.copy()
+    
+    # Time of the values
+    key = 'Date (UTC)' if 'Date (UTC)' in df.columns and 'Date (UTC)' in latest.columns else 'Date'
+    
+    # Same columns and types as the corrected archive
+    if 'Date' in df.columns and 'Date' not in latest.columns:
+        # Date of hourly values
+        if pd.api.types.is_datetime64_any_dtype(df['Date']):
+            latest['Date'] = latest['Date (UTC)'].dt.normalize()
+        else:
+            latest['Date'] = latest['Date (UTC)'].dt.strftime('%Y-%m-%d')
+    latest = latest.reindex(columns=df.columns)
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]) and not pd.api.types.is_datetime64_any_dtype(latest[col]):
+            latest[col] = pd.to_datetime(latest[col])
+    
+    # New rows only
+    latest = latest.loc[~latest[key].isin(df[key])].drop_duplicates()
+    df = pd.concat([df, latest], ignore_index=True)
+    if not df[key].is_monotonic_increasing:
+        df = df.sort_values(key, kind='stable', ignore_index=True)
+    return df
+
+def get_refreshed(param, station, use_cache=True):
+    # Corrected archive extended with the latest months. The archive is read from the 
+    # cache (downloaded again only when SMHI reports the station as updated), 
+    # so a refresh only downloads the latest months
+    param = get_param_value(param)
+    
+    if use_cache:
+        df = memory_get(('refreshed', param, station), max_age=LATEST_MONTHS_TTL)
+        if df is not None:
+            return df
+    
+    df = merge_latest(get_corrected(param, station, use_cache=use_cache), 
+                      get_latest_months(param, station, use_cache=use_cache))
+    
+    if use_cache:
+        memory_put(('refreshed', param, station), df)
+        df = df.copy(deep=False)
+    
+    return df
+
+
+def get_many(items, func=None, max_workers=None, errors='raise'):
+    # Download and parse data concurrently
+    # Input
+    #   items           : list of arguments to func, e.g. [(param, station), ...]
+    #   func            : function to call, default get_corrected
+    #   max_workers     : max number of concurrent calls, default MAX_WORKERS
+    #   errors          : 'raise' or 'ignore' (result is None for failed calls)
+    # Output
+    #   dict with the items as keys
+    if func is None:
+        func = get_corrected
+    if max_workers is None:
+        max_workers = MAX_WORKERS
+    
+    # Remove duplicates, keep order
+    items = list(dict.fromkeys(tuple(item) for item in items))
+    if len(items)==0:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = {item : executor.submit(func, *item) for item in items}
+        results = {}
+        for item, future in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                if errors == 'raise':
+                    raise
+                logging.warning('%s%s failed: %s' % (func.__name__, item, e))
+                results[item] = None
+        return results
+
+def get_values_many(params, station, ts=None, time_period=None, idx='Date', col='Value', direction=None):
+    # Values of several weather parameters for a station, downloaded concurrently
+    # Output
+    #   list of values in the order of params
+    params = [get_param_value(param) for param in params]
+    data = get_many([(param, station, idx) for param in params], func=get_indexed)
+    return [get_values(param, station, ts, time_period, idx=idx, col=col, direction=direction, data=data[(param, station, idx)]) 
+            for param in params]
+
+def get_values(param, station, ts=None, time_period=None, idx='Date', col='Value', check_station=False, direction=None, data=None):
     # validate input weather parameter (param)
     parameter_id = get_param_value(param)
     
@@ -298,14 +877,27 @@ def get_values(param, station, ts=None, time_period=None, idx='Date', col='Value
         if isin_station(parameter_id, station):
            print('Paramater not avaiable for selected station') 
         
-    # Download corrected historical data (last 3 months not available)
-    data = get_corrected(parameter_id, station, json=True)
+    # Download corrected historical data (last 3 months not available), indexed by idx
+    if data is None and CUBE_DIR and idx == 'Date (UTC)' and col == 'Value':
+        # slice the time window of ts from the memory-mapped cube (see cube.py)
+        import cube
+        if cube.has_station(parameter_id, station):
+            start, end = (None, None) if ts is None else helpers.get_window(ts, time_period, direction)
+            data = cube.get_cube_values(parameter_id, station, start, end)
+    if data is None and STORE_DIR:
+        # read only the years and columns needed from the columnar store
+        import store
+        columns = [idx, col, 'From Date (UTC)', 'To Date (UTC)'] if col is not None else None
+        data = helpers.index_time(store.get_stored(parameter_id, station, ts, time_period, 
+                                                   direction, columns), idx)
+    elif data is None:
+        data = get_indexed(parameter_id, station, idx)
     
     # if timestamp in input filter data based on timestamp and time period
     # idx specified index column and col data column
     if ts is not None:
         values = helpers.filter_time(data, ts, time_period, idx=idx, col=col, direction=direction)
     else:
-        values = data.set_index(idx)[col]
+        values = helpers.set_index(data, idx)[col]
         
     return values
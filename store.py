@@ -0,0 +1,198 @@
+import smhi
+import helpers
+import json
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+
+# Columnar store of corrected archives, one parquet dataset per parameter and station
+# partitioned by year (<STORE_DIR>/<param>_<station>/year=YYYY/part-0.parquet),
+# with one row group per month. Reading a time window only opens the files of its years
+# and the row groups of its months (needs pyarrow).
+#   timestamps      : int64 (ns since 1970)
+#   Value           : float32, or dictionary encoded text (precipitation type)
+#   Quality, texts  : dictionary encoded
+
+# Columns tried in order as time key of partitions and row groups
+KEY_COLUMNS = ['Date (UTC)', 'Date', 'From Date (UTC)']
+# Decimals values are rounded to when read back from float32 (SMHI values have at most 2)
+VALUE_DECIMALS = 3
+# Days added before and after a time window, to include From/To Date rows covering ts
+WINDOW_PAD = pd.Timedelta(days=32)
+
+def get_store_path(param, station):
+    # Folder of stored dataset (None if store is disabled)
+    if not smhi.STORE_DIR:
+        return None
+    return os.path.join(smhi.STORE_DIR, '%s_%s' % (param, station))
+
+def get_key_column(df):
+    # Time column used for partitions and row groups
+    for col in KEY_COLUMNS:
+        if col in df.columns and pd.api.types.is_datetime64_dtype(df[col]):
+            return col
+    raise ValueError('No time column in %s' % list(df.columns))
+
+def read_info(param, station):
+    # Stored key column and update timestamp (None if not stored)
+    path = get_store_path(param, station)
+    if path is None or not os.path.isfile(os.path.join(path, '_info.json')):
+        return None
+    with open(os.path.join(path, '_info.json')) as f:
+        return json.load(f)
+
+def to_table(df):
+    # Arrow table with compact column types
+    import pyarrow as pa
+    arrays, names = [], []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_dtype(values):
+            array = pa.array(values.values.view('int64'), pa.int64(), mask=values.isna().values)
+        elif pd.api.types.is_float_dtype(values):
+            array = pa.array(values.values.astype('float32'), pa.float32(), from_pandas=True)
+        elif pd.api.types.is_numeric_dtype(values):
+            array = pa.array(values.values)
+        else:
+            array = pa.array(values.astype('object').values, pa.string(), from_pandas=True).dictionary_encode()
+        arrays.append(array)
+        names.append(col)
+    return pa.Table.from_arrays(arrays, names)
+
+def from_table(table, datetime_cols):
+    # Data frame as returned by smhi.get_corrected from stored table
+    df = table.to_pandas()
+    for col in df.columns:
+        if col in datetime_cols:
+            df[col] = df[col].values.astype('datetime64[ns]')
+        elif df[col].dtype == 'float32':
+            df[col] = np.round(df[col].values.astype('float64'), VALUE_DECIMALS)
+        elif isinstance(df[col].dtype, pd.CategoricalDtype) and col not in ['Value', 'Quality']:
+            df[col] = df[col].astype('object')
+    return df
+
+def write_store(param, station, df, updated=None):
+    # Save corrected archive df as year partitions with one row group per month
+    import pyarrow.parquet as pq
+    path = get_store_path(param, station)
+    if path is None:
+        return
+    # empty archives (header only, columns not translated) are stored without partitions
+    key = get_key_column(df) if len(df) > 0 else None
+    if key is not None:
+        df = df.sort_values(key, kind='stable').reset_index(drop=True)
+        times = df[key].values
+    else:
+        times = np.array([], 'datetime64[ns]')
+    table = to_table(df)
+    years = times.astype('datetime64[Y]').astype('int64') + 1970
+    months = times.astype('datetime64[M]').astype('int64')
+
+    # write to temporary folder first so an interrupted write never leaves a broken store
+    tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    for year in np.unique(years):
+        folder = os.path.join(tmp_path, 'year=%d' % year)
+        os.makedirs(folder)
+        i1, i2 = years.searchsorted(year, 'left'), years.searchsorted(year, 'right')
+        bounds = np.flatnonzero(np.diff(months[i1:i2])) + 1
+        with pq.ParquetWriter(os.path.join(folder, 'part-0.parquet'), table.schema) as writer:
+            for j1, j2 in zip(np.r_[0, bounds], np.r_[bounds, i2-i1]):
+                writer.write_table(table.slice(i1+j1, j2-j1))
+
+    info = {'key' : key,
+            'columns' : list(df.columns),
+            'datetime' : [col for col in df.columns if pd.api.types.is_datetime64_dtype(df[col])],
+            'dtypes' : {col : str(df[col].dtype) for col in df.columns},
+            'updated' : None if updated is None else str(updated)}
+    os.makedirs(tmp_path, exist_ok=True)
+    with open(os.path.join(tmp_path, '_info.json'), 'w') as f:
+        json.dump(info, f)
+
+    old_path = None
+    if os.path.isdir(path):
+        old_path = '%s.%d.old' % (path, threading.get_ident())
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+def read_store(param, station, start=None, end=None, columns=None):
+    # Read stored archive, only files of years and row groups of months overlapping start to end
+    # Input
+    #   start, end      : first and last time (Timestamp or string), None reads all
+    #   columns         : columns to read (if stored), default all
+    # Output
+    #   data frame as smhi.get_corrected, None if not stored
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    info = read_info(param, station)
+    if info is None:
+        return None
+    path = get_store_path(param, station)
+    start = pd.Timestamp.min if start is None else pd.Timestamp(start)
+    end = pd.Timestamp.max if end is None else pd.Timestamp(end)
+    if columns is not None:
+        columns = [col for col in info['columns'] if col in columns]
+
+    files = sorted(folder for folder in os.listdir(path) if folder.startswith('year='))
+    tables = []
+    for folder in files:
+        if not start.year <= int(folder[5:]) <= end.year:
+            continue
+        pf = pq.ParquetFile(os.path.join(path, folder, 'part-0.parquet'))
+        # prune row groups by min and max time of key column
+        k = pf.schema_arrow.get_field_index(info['key'])
+        groups = []
+        for i in range(pf.num_row_groups):
+            stats = pf.metadata.row_group(i).column(k).statistics
+            if stats is None or not stats.has_min_max or (stats.max >= start.value and stats.min <= end.value):
+                groups.append(i)
+        tables.append(pf.read_row_groups(groups, columns=columns, use_threads=False))
+    if len(files) == 0:
+        # empty archive, frame with stored columns and types
+        dtypes = info.get('dtypes', {})
+        return pd.DataFrame({col : pd.Series(dtype=dtypes.get(col, 'datetime64[ns]' if col in info['datetime'] else object)) 
+                             for col in info['columns'] if columns is None or col in columns})
+    if len(tables) == 0:
+        # empty frame with stored columns
+        pf = pq.ParquetFile(os.path.join(path, files[0], 'part-0.parquet'))
+        tables.append(pf.read_row_groups([], columns=columns))
+    return from_table(pa.concat_tables(tables), info['datetime'])
+
+def clear_store(param=None, station=None):
+    # Remove stored archives, all or for given parameter and/or station
+    if not smhi.STORE_DIR or not os.path.isdir(smhi.STORE_DIR):
+        return
+    if param is not None:
+        param = smhi.get_param_value(param)
+    for folder in os.listdir(smhi.STORE_DIR):
+        key = folder.split('.')[0].split('_')
+        if param is not None and key[0] != str(param):
+            continue
+        if station is not None and key[-1] != str(station):
+            continue
+        shutil.rmtree(os.path.join(smhi.STORE_DIR, folder), ignore_errors=True)
+
+def update_store(param, station):
+    # Store corrected archive if missing or outdated, returns stored info
+    param = smhi.get_param_value(param)
+    updated = smhi.get_updated(param, station)
+    info = read_info(param, station)
+    if info is None or info['updated'] != (None if updated is None else str(updated)):
+        write_store(param, station, smhi.get_corrected(param, station), updated)
+        info = read_info(param, station)
+    return info
+
+def get_stored(param, station, ts=None, time_period=None, direction=None, columns=None):
+    # Corrected archive from the store (stored first if missing or outdated),
+    # only the rows around the time window of ts and time_period if ts is given
+    param = smhi.get_param_value(param)
+    update_store(param, station)
+    if ts is None:
+        return read_store(param, station, columns=columns)
+    start, end = helpers.get_window(ts, time_period, direction)
+    return read_store(param, station, start - WINDOW_PAD, end + WINDOW_PAD, columns=columns)